@@ -0,0 +1,330 @@
+"""
+Benchmarks for the numbering plan pipeline of mxnumplan.py
+
+Each stage of the pipeline is timed and its peak memory (as traced by tracemalloc) is recorded:
+
+* read_csv: decompress the ZIP and parse the CSV (patterns_from_zip)
+* mobile_patterns: read the CSV, filter the MOVIL ranges and create the Pattern objects
+* expand_patterns: sort and expand the mobile ranges to simple patterns
+* summarize_10 .. summarize_3: one sort + summarize pass per pattern length
+* trie: summarize the mobile ranges with the PatternTrie used by optimize_patterns
+* list_compare: compare the summarized patterns with a modified set of patterns
+* reconcile_plan: plan the changes against a synthetic UCM inventory
+
+Besides the snapshot in the repository synthetic snapshots with 10x and 100x the number of rows are benchmarked. The
+synthetic snapshots are created once in a work directory and then reused. The copies of the rows in a synthetic
+snapshot overlap; the summarize passes don't merge overlapping ranges and hence end with more patterns than the trie.
+
+Results are appended to a JSON file together with the version (git describe) of the code. The timings of each run are
+compared to the previous run in the file so that regressions are visible.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+from io import TextIOWrapper
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+import mxnumplan
+from mxnumplan import Pattern, PatternTrie, PatternState, ReconcilePlan
+
+SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pnn_Publico_13_05_2019.zip')
+RESULTS_FILE = 'bench_results.json'
+
+# column of the series in the CSV; the series is shifted to create additional distinct ranges in scaled snapshots
+SERIE_COLUMN = 8
+
+
+def scaled_snapshot(zip_file_name, scale, work_dir) -> str:
+    """
+    Create a synthetic snapshot with scale times the rows of a given snapshot. Each copy of the rows has the series
+    shifted by a different offset. The snapshot is only created if it doesn't exist in the work directory yet
+    :param zip_file_name: original snapshot
+    :param scale: number of copies of the rows
+    :param work_dir: directory for the synthetic snapshots
+    :return: name of the synthetic ZIP file
+    """
+    if scale == 1:
+        return zip_file_name
+    base = os.path.splitext(os.path.basename(zip_file_name))[0]
+    file_name = os.path.join(work_dir, f'{base}_x{scale}.zip')
+    if os.path.isfile(file_name):
+        return file_name
+    print(f'Creating {file_name}...')
+    with zipfile.ZipFile(zip_file_name) as zip_file:
+        member = zip_file.filelist[0].filename
+        with zip_file.open(member) as csv_file:
+            rows = list(csv.reader(TextIOWrapper(csv_file, encoding='utf8', newline='')))
+    header, rows = rows[0], rows[1:]
+    tmp_name = f'{file_name}.tmp'
+    with zipfile.ZipFile(tmp_name, mode='w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+        with zip_file.open(member, mode='w', force_zip64=True) as csv_file:
+            text_file = TextIOWrapper(csv_file, encoding='utf8', newline='')
+            writer = csv.writer(text_file, lineterminator='\r\n')
+            writer.writerow(header)
+            for copy in range(scale):
+                for row in rows:
+                    serie = row[SERIE_COLUMN]
+                    if copy:
+                        row = list(row)
+                        row[SERIE_COLUMN] = f'{(int(serie) + copy * 1009) % 10 ** len(serie):0{len(serie)}d}'
+                    writer.writerow(row)
+                # for
+            # for
+            text_file.flush()
+            text_file.detach()
+        # with
+    # with
+    os.replace(tmp_name, file_name)
+    return file_name
+
+
+def git_version() -> Optional[str]:
+    """
+    Version of the code being benchmarked
+    :return: output of git describe; None if not available
+    """
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(func: Callable, repeat=1, memory=True) -> Tuple[object, float, Optional[float]]:
+    """
+    Time a function and trace its peak memory. The function is called repeat times untraced for the timing and once
+    more under tracemalloc for the peak memory
+    :param func: function w/o parameters
+    :param repeat: number of timed calls; the best time is taken
+    :param memory: False: don't trace memory
+    :return: result of the (last) call, best time in seconds, peak memory in MB (None if not traced)
+    """
+    best = None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        # for
+        peak = None
+        if memory:
+            result = None
+            tracemalloc.start()
+            try:
+                result = func()
+                peak = tracemalloc.get_traced_memory()[1] / 1e6
+            finally:
+                tracemalloc.stop()
+    # with
+    return result, best, peak
+
+
+def count_rows(zip_file_name) -> int:
+    """
+    Read all rows of a snapshot w/o keeping them
+    :param zip_file_name:
+    :return: number of rows
+    """
+    count = 0
+    for count, _ in enumerate(mxnumplan.patterns_from_file(zip_file_name), 1):
+        pass
+    return count
+
+
+def mobile_patterns(zip_file_name) -> List[Pattern]:
+    """
+    Patterns of the mobile ranges of a snapshot
+    :param zip_file_name:
+    :return:
+    """
+    return [Pattern(p) for p in mxnumplan.patterns_from_file(zip_file_name) if p[' TIPO_RED'] == 'MOVIL']
+
+
+def trie_patterns(patterns: List[Pattern]) -> List[Pattern]:
+    """
+    Summarize patterns with a PatternTrie
+    :param patterns:
+    :return:
+    """
+    trie = PatternTrie()
+    for pattern in patterns:
+        trie.add(pattern)
+    return trie.patterns()
+
+
+def modified_patterns(patterns: List[Pattern]) -> List[Pattern]:
+    """
+    Sorted copy of a list of patterns with every 20th pattern removed and every 50th simple pattern replaced by the
+    patterns one digit longer
+    :param patterns:
+    :return:
+    """
+    modified = []
+    for i, pattern in enumerate(patterns):
+        if not i % 20:
+            continue
+        if not i % 50 and not pattern.mask and pattern.prefix_len < 10:
+            modified.extend(Pattern.from_digits(pattern.prefix_int * 10 + digit, pattern.prefix_len + 1)
+                            for digit in range(10))
+            continue
+        modified.append(pattern)
+    # for
+    modified.sort()
+    return modified
+
+
+def ucm_inventory(desired: List[PatternState], seed=0) -> List[PatternState]:
+    """
+    Synthetic inventory of patterns in UCM: 5% of the desired patterns are missing, 2% have a different block setting
+    and 5% are stale patterns not desired anymore
+    :param desired:
+    :param seed:
+    :return:
+    """
+    rng = random.Random(seed)
+    existing = []
+    for i, p in enumerate(desired):
+        r = rng.random()
+        if r < 0.05:
+            continue
+        uuid = f'{{{i:08X}-0000-0000-0000-000000000000}}'
+        if r < 0.07:
+            existing.append(p._replace(block_enable=not p.block_enable, uuid=uuid))
+        else:
+            existing.append(p._replace(uuid=uuid))
+        if r > 0.95:
+            existing.append(PatternState(pattern=f'{p.pattern}#', block_enable=True, urgency=True,
+                                         uuid=f'{{{i:08X}-0000-0000-0000-000000000001}}'))
+    # for
+    return existing
+
+
+def benchmark(zip_file_name, scale, repeat=1, memory=True) -> List[dict]:
+    """
+    Benchmark all stages on a given snapshot
+    :param zip_file_name:
+    :param scale: scale of the snapshot; recorded with the results
+    :param repeat: number of timed runs per stage
+    :param memory: False: don't trace memory
+    :return: one result dict per stage
+    """
+    results = []
+
+    def stage(name, func, items: Callable = len):
+        result, seconds, peak = measure(func, repeat=repeat, memory=memory)
+        results.append({'scale': scale, 'stage': name, 'seconds': round(seconds, 4),
+                        'peak_mb': None if peak is None else round(peak, 1), 'items': items(result)})
+        print(f'x{scale:<4} {name:16} {seconds:9.3f} s {"" if peak is None else f"{peak:9.1f} MB"} '
+              f'{results[-1]["items"]:>10}')
+        return result
+
+    stage('read_csv', lambda: count_rows(zip_file_name), items=lambda count: count)
+    patterns = stage('mobile_patterns', lambda: mobile_patterns(zip_file_name))
+    expanded = stage('expand_patterns', lambda: list(Pattern.expand_patterns(sorted(patterns))))
+    summarized = expanded
+    for pattern_len in range(10, 2, -1):
+        summarized = stage(f'summarize_{pattern_len}',
+                           lambda: list(Pattern.summarize(sorted(summarized), pattern_len)))
+    del expanded
+    trie = stage('trie', lambda: trie_patterns(patterns))
+    del patterns
+    modified = modified_patterns(trie)
+    stage('list_compare', lambda: mxnumplan.list_compare(modified, trie), items=lambda r: len(r[0]) + len(r[1]))
+    desired = [PatternState(pattern=p.for_ucm, block_enable=True, urgency=True) for p in trie]
+    existing = ucm_inventory(desired)
+    stage('reconcile_plan', lambda: ReconcilePlan(desired, existing),
+          items=lambda plan: len(plan.add) + len(plan.update) + len(plan.remove))
+    return results
+
+
+def read_results(file_name) -> List[dict]:
+    """
+    Read results of previous runs
+    :param file_name:
+    :return: list of runs; empty if the file doesn't exist
+    """
+    if not os.path.isfile(file_name):
+        return []
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def print_comparison(runs: List[dict], current: dict):
+    """
+    Print the timings of a run compared to the latest previous run with the same scale and stage
+    :param runs: previous runs
+    :param current:
+    :return:
+    """
+    before = {}
+    for run in runs:
+        for r in run['results']:
+            before[(r['scale'], r['stage'])] = (run, r)
+    # for
+    for r in current['results']:
+        run, p = before.get((r['scale'], r['stage']), (None, None))
+        if p is None or not p['seconds']:
+            continue
+        change = (r['seconds'] / p['seconds'] - 1) * 100
+        print(f'x{r["scale"]:<4} {r["stage"]:16} {p["seconds"]:9.3f} s -> {r["seconds"]:9.3f} s {change:+7.1f}% '
+              f'(vs. {run["version"]} {run["timestamp"]})')
+    # for
+    return
+
+
+def main():
+    args = argparse.ArgumentParser(description='Benchmark the numbering plan pipeline: time and peak memory of each '
+                                               'stage on the snapshot and on synthetic snapshots scaled up from it. '
+                                               'Results are appended to a JSON file.')
+    args.add_argument('--fromfile', default=SNAPSHOT, help=f'snapshot (ZIP file) to benchmark; default: {SNAPSHOT}')
+    args.add_argument('--scale', default='1,10,100',
+                      help='comma separated list of scales. Scale n benchmarks a synthetic snapshot with n times the '
+                           'rows of the snapshot; default: 1,10,100')
+    args.add_argument('--repeat', type=int, default=1, help='number of timed runs per stage; the best is reported')
+    args.add_argument('--nomemory', action='store_true', help="don't trace peak memory (saves one run per stage)")
+    args.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'mxnumplan_bench'),
+                      help='directory for the synthetic snapshots. They are created once and then reused')
+    args.add_argument('--output', default=RESULTS_FILE,
+                      help=f'JSON file the results are appended to; default: {RESULTS_FILE}')
+    parsed_args = args.parse_args()
+
+    scales = [int(s) for s in parsed_args.scale.split(',')]
+    os.makedirs(parsed_args.workdir, exist_ok=True)
+    run = {'timestamp': datetime.now().isoformat(timespec='seconds'),
+           'version': git_version(),
+           'python': platform.python_version(),
+           'numpy': np.__version__,
+           'platform': platform.platform(),
+           'snapshot': os.path.basename(parsed_args.fromfile),
+           'results': []}
+    for scale in scales:
+        zip_file_name = scaled_snapshot(parsed_args.fromfile, scale, parsed_args.workdir)
+        run['results'].extend(benchmark(zip_file_name, scale, repeat=parsed_args.repeat,
+                                        memory=not parsed_args.nomemory))
+    # for
+
+    runs = read_results(parsed_args.output)
+    print_comparison(runs, run)
+    runs.append(run)
+    with open(parsed_args.output, 'w') as f:
+        json.dump(runs, f, indent=2)
+    print(f'Results written to {parsed_args.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,27 +24,390 @@ This Python script:
 """
 import zipfile
 import ucmaxl
+import zeep.exceptions
 import requests
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-from tempfile import TemporaryFile
-from csv import DictReader
-from io import TextIOWrapper, RawIOBase
-from typing import Iterable, Generator, List, Tuple
-from itertools import chain
+from urllib.parse import urljoin, parse_qs
+from csv import DictReader, reader, writer
+from io import TextIOWrapper, RawIOBase, StringIO
+from typing import Iterable, Generator, List, Tuple, Union, Optional, NamedTuple, Set, Dict
+from itertools import chain, repeat
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 import argparse
 import logging
 import os
 import re
-from collections import OrderedDict
+import random
+import threading
+import time
+from collections import OrderedDict, deque, Counter
+from bisect import bisect_left, bisect_right
 import cgi
 import urllib3
 import functools
+import hashlib
+import json
+import struct
+import zlib
+import codecs
+import gzip
+import gc
+import atexit
+import sys
+from contextlib import contextmanager
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from operator import itemgetter
 from tqdm import tqdm
+import numpy as np
+
+try:
+    # not available on Windows; peak RSS is not profiled there
+    import resource
+except ImportError:
+    resource = None
 
 BASE_URL = 'https://sns.ift.org.mx:8081/sns-frontend/planes-numeracion/descarga-publica.xhtml'
 PARTITION_NAME = 'mobile'
 
+# bump if the content of the cache files changes
+CACHE_VERSION = 1
+
+# max number of patterns to remove with a single SQL statement
+SQL_BATCH_SIZE = 200
+
+# name and HTTP validators of the last ZIP downloaded from the web site
+DOWNLOAD_STATE_FILE = 'pnn_Publico_download.json'
+
+# approximate size of the chunks of CDR files classified by one worker process at a time
+CDR_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+class Profiler:
+    """
+    Stage level profile of a run (--profile): wall time, CPU time, peak RSS and number of objects tracked by the
+    garbage collector per stage, and latency histograms of the AXL requests per operation. A disabled profiler
+    doesn't record anything.
+    Stages can overlap: csv_parse includes unzip, download includes parsing the ZIP while it is downloaded, and stages
+    of clusters provisioned in parallel run at the same time
+    """
+    # upper bounds of the buckets of the AXL latency histograms in seconds
+    LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages: List[dict] = []
+        # name of AXL operation -> list of (duration, error) with error None, 'error' or 'throttled'
+        self.calls: Dict[str, List[Tuple[float, Optional[str]]]] = {}
+        # (name, labels) -> value; for example number of patterns added on a cluster
+        self.values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def enable(self):
+        """
+        Enable the profiler; the profile starts now
+        :return:
+        """
+        self.enabled = True
+        self.started = time.time()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    @staticmethod
+    def peak_rss() -> Optional[float]:
+        """
+        Peak resident set size of the process so far
+        :return: peak RSS in MB; None if not available
+        """
+        if resource is None:
+            return None
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kB on Linux, bytes on macOS
+        return round(rss / (1e6 if sys.platform == 'darwin' else 1e3), 1)
+
+    def add_stage(self, record: dict):
+        with self.lock:
+            self.stages.append(record)
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """
+        Profile a stage:
+            with profiler.stage('trie') as stage:
+                ...
+                stage['items'] = len(patterns)
+        :param name: name of the stage
+        :param labels: additional information recorded with the stage; for example the UCM cluster
+        :return: record of the stage; can be updated with the number of processed items
+        """
+        if not self.enabled:
+            yield {}
+            return
+        objects = len(gc.get_objects())
+        wall, cpu = time.perf_counter(), time.process_time()
+        record = {'stage': name, **labels, 'start': round(wall - self.start_wall, 4)}
+        try:
+            yield record
+        finally:
+            record['wall'] = round(time.perf_counter() - wall, 4)
+            record['cpu'] = round(time.process_time() - cpu, 4)
+            record['peak_rss_mb'] = self.peak_rss()
+            record['objects'] = len(gc.get_objects())
+            record['objects_delta'] = record['objects'] - objects
+            self.add_stage(record)
+        return
+
+    def timed(self, name, iterable: Iterable, **labels) -> Iterable:
+        """
+        Profile the time spent to produce the items of an iterable; for example the decompression of the lines of a
+        CSV while the lines are parsed. The stage is recorded once the iterable is exhausted
+        :param name: name of the stage
+        :param iterable:
+        :param labels: additional information recorded with the stage
+        :return: iterable yielding the same items
+        """
+        if not self.enabled:
+            return iterable
+
+        def timed_iterable():
+            record = {'stage': name, **labels, 'start': round(time.perf_counter() - self.start_wall, 4)}
+            wall = cpu = 0.0
+            items = 0
+            iterator = iter(iterable)
+            while True:
+                start_wall, start_cpu = time.perf_counter(), time.process_time()
+                item = next(iterator, self)
+                wall += time.perf_counter() - start_wall
+                cpu += time.process_time() - start_cpu
+                if item is self:
+                    break
+                items += 1
+                yield item
+            # while
+            record.update(wall=round(wall, 4), cpu=round(cpu, 4), peak_rss_mb=self.peak_rss(), items=items)
+            self.add_stage(record)
+            return
+
+        return timed_iterable()
+
+    def axl_call(self, operation, seconds, error):
+        """
+        Record an AXL request. Used as observer of AXL helpers: axl.add_observer(profiler.axl_call)
+        :param operation: name of the AXL operation
+        :param seconds: duration of the request
+        :param error: exception raised by the request; None if the request succeeded
+        :return:
+        """
+        if error is not None:
+            error = 'throttled' if ucmaxl.AXLHelper.is_throttling_error(error) else 'error'
+        with self.lock:
+            self.calls.setdefault(operation, []).append((seconds, error))
+
+    def set_value(self, name, value, **labels):
+        """
+        Record a value, for example the number of patterns added on a cluster
+        :param name:
+        :param value:
+        :param labels: additional information identifying the value; for example the UCM cluster
+        :return:
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    @classmethod
+    def latency_summary(cls, calls: List[Tuple[float, Optional[str]]]) -> dict:
+        """
+        Summary of the AXL requests of one operation: counts, quantiles and cumulative histogram of the latencies
+        :param calls: list of (duration, error)
+        :return:
+        """
+        latencies = sorted(seconds for seconds, _ in calls)
+
+        def quantile(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 4)
+
+        buckets = OrderedDict((str(le), bisect_right(latencies, le)) for le in cls.LATENCY_BUCKETS)
+        buckets['+Inf'] = len(latencies)
+        return {'count': len(calls),
+                'errors': sum(1 for _, error in calls if error == 'error'),
+                'throttled': sum(1 for _, error in calls if error == 'throttled'),
+                'total': round(sum(latencies), 4),
+                'min': round(latencies[0], 4), 'p50': quantile(0.5), 'p90': quantile(0.9), 'p99': quantile(0.99),
+                'max': round(latencies[-1], 4),
+                'buckets': buckets}
+
+    def report(self) -> dict:
+        """
+        Profile as dict for JSON export
+        :return:
+        """
+        with self.lock:
+            stages = list(self.stages)
+            calls = {operation: list(c) for operation, c in self.calls.items()}
+            values = [{'name': name, **dict(labels), 'value': value}
+                      for (name, labels), value in sorted(self.values.items())]
+        return {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'wall': round(time.perf_counter() - self.start_wall, 4),
+                'cpu': round(time.process_time() - self.start_cpu, 4),
+                'peak_rss_mb': self.peak_rss(),
+                'stages': sorted(stages, key=itemgetter('start')),
+                'axl': {operation: self.latency_summary(c) for operation, c in sorted(calls.items())},
+                'values': values}
+
+    def write(self, file_name):
+        """
+        Write the profile as JSON to a file or to the console
+        :param file_name: '-' to print the profile to the console
+        :return:
+        """
+        report = json.dumps(self.report(), indent=2)
+        if file_name == '-':
+            print(report)
+            return
+        with open(file_name, 'w') as f:
+            f.write(report)
+        print(f'Profile written to {file_name}')
+        return
+
+
+# profile of the run; enabled by --profile, --metricsport and --metricsfile
+profiler = Profiler()
+
+
+class MetricsExporter:
+    """
+    Prometheus metrics of a run in text exposition format, based on the profile of the run: AXL requests, errors,
+    throttling faults and latency quantiles per operation, patterns added/updated/removed/unchanged per cluster and
+    stage durations. The metrics can be served on a local HTTP endpoint while the run is in progress and/or written
+    to a file for the textfile collector of the node exporter
+    """
+    PREFIX = 'mxnumplan'
+
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+
+    @staticmethod
+    def labels(**labels) -> str:
+        """
+        Label set in exposition format
+        :param labels:
+        :return: for example {operation="addTransPattern"}; empty string if there are no labels
+        """
+        if not labels:
+            return ''
+
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+    def exposition(self) -> str:
+        """
+        All metrics in text exposition format
+        :return:
+        """
+        report = self.profiler.report()
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            name = f'{self.PREFIX}_{name}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for suffix, labels, value in samples:
+                lines.append(f'{name}{suffix}{self.labels(**labels)} {value}')
+            # for
+
+        axl = report['axl']
+        metric('axl_requests_total', 'counter', 'AXL requests by operation',
+               [('', {'operation': o}, s['count']) for o, s in axl.items()])
+        metric('axl_errors_total', 'counter', 'failed AXL requests by operation (w/o throttling faults)',
+               [('', {'operation': o}, s['errors']) for o, s in axl.items()])
+        metric('axl_throttled_total', 'counter', 'AXL requests throttled by UCM by operation',
+               [('', {'operation': o}, s['throttled']) for o, s in axl.items()])
+        samples = []
+        for o, s in axl.items():
+            samples.extend(('', {'operation': o, 'quantile': q}, s[f'p{int(float(q) * 100)}'])
+                           for q in ('0.5', '0.9', '0.99'))
+            samples.append(('_sum', {'operation': o}, s['total']))
+            samples.append(('_count', {'operation': o}, s['count']))
+        # for
+        metric('axl_request_duration_seconds', 'summary', 'latency of AXL requests by operation', samples)
+
+        values = {}
+        for v in report['values']:
+            v = dict(v)
+            values.setdefault(v.pop('name'), []).append(('', v, v.pop('value')))
+        # for
+        metric('patterns', 'gauge', 'patterns by cluster and action (add, update, remove: done; unchanged)',
+               values.get('patterns', []))
+        metric('patterns_planned', 'gauge', 'patterns planned to be added, updated or removed by cluster',
+               values.get('patterns_planned', []))
+        metric('patterns_failed', 'gauge', 'patterns which could not be added, updated or removed by cluster',
+               values.get('patterns_failed', []))
+
+        # stages which ran several times are summed up
+        durations = OrderedDict()
+        for stage in report['stages']:
+            labels = tuple((k, v) for k, v in stage.items() if k == 'stage' or k == 'cluster')
+            durations[labels] = durations.get(labels, 0) + stage['wall']
+        # for
+        metric('stage_duration_seconds', 'gauge', 'wall time of the stages of the run',
+               [('', dict(labels), round(seconds, 4)) for labels, seconds in durations.items()])
+        metric('run_start_timestamp_seconds', 'gauge', 'start of the run', [('', {}, round(self.profiler.started, 3))])
+        metric('run_duration_seconds', 'gauge', 'wall time of the run so far', [('', {}, report['wall'])])
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, address='localhost') -> HTTPServer:
+        """
+        Serve the metrics on http://address:port/metrics in a background thread
+        :param port:
+        :param address:
+        :return: the HTTP server
+        """
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = exporter.exposition().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(f'metrics: {format % args}')
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        server = Server((address, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        print(f'Serving metrics on http://{address}:{server.server_address[1]}/metrics')
+        return server
+
+    def write(self, file_name):
+        """
+        Write the metrics to a file. The file is replaced atomically so that the textfile collector never reads a
+        partial file
+        :param file_name: for example /var/lib/node_exporter/textfile_collector/mxnumplan.prom
+        :return:
+        """
+        tmp_name = f'{file_name}.tmp'
+        with open(tmp_name, 'w') as f:
+            f.write(self.exposition())
+        os.replace(tmp_name, file_name)
+        print(f'Metrics written to {file_name}')
+        return
+
 
 def patterns_from_zip(file: RawIOBase) -> Generator[OrderedDict, None, None]:
     """
@@ -58,7 +421,7 @@ def patterns_from_zip(file: RawIOBase) -> Generator[OrderedDict, None, None]:
         print(f'Reading number ranges from {file_name}...')
         with zip.open(name=file_name) as csv_file:
             text_file = TextIOWrapper(csv_file, encoding='utf8', newline='')
-            dict_reader = DictReader(text_file)
+            dict_reader = DictReader(profiler.timed('unzip', text_file))
             for p in dict_reader:
                 yield p
             # for
@@ -67,14 +430,59 @@ def patterns_from_zip(file: RawIOBase) -> Generator[OrderedDict, None, None]:
     return
 
 
-def patterns_from_web() -> Generator[OrderedDict, None, None]:
+def read_download_state() -> dict:
     """
-    Read ZIP file from Mexican numbering plan authority web site and yield patterns from that ZIP
+    Read name and HTTP validators (ETag, Last-Modified) of the last ZIP downloaded from the web site
+    :return: dict with keys file_name, etag, last_modified, complete. Empty if there is no download state
+    """
+    try:
+        with open(DOWNLOAD_STATE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_download_state(file_name, headers, complete):
+    """
+    Remember name and HTTP validators of a ZIP downloaded from the web site
+    :param file_name: name of the ZIP file
+    :param headers: headers of the response
+    :param complete: False: the download is in progress; the validators are only used to resume the download.
+        True: the ZIP is complete; the validators are used for conditional requests
     :return:
     """
-    print(f'Accessing numbering plan information web site at {BASE_URL} ...')
+    with open(DOWNLOAD_STATE_FILE, 'w') as f:
+        json.dump({'file_name': file_name,
+                   'etag': headers.get('etag'),
+                   'last_modified': headers.get('last-modified'),
+                   'complete': complete}, f)
+    return
+
+
+def zip_from_web(base_url=BASE_URL) -> str:
+    """
+    Download ZIP file from Mexican numbering plan authority web site
+    :param base_url: URL of the download page
+    :return: name of the ZIP file (same file name as obtained from the web site)
+    """
+    file_name, _ = download_zip(base_url)
+    return file_name
+
+
+def download_zip(base_url=BASE_URL, parse=None) -> Tuple[str, object]:
+    """
+    Download ZIP file from Mexican numbering plan authority web site.
+    The download is skipped if the web site reports the last downloaded ZIP as not modified (ETag/Last-Modified). The
+    ZIP is written to a .part file which is renamed once the download is complete; an interrupted download is resumed
+    if the web site supports range requests
+    :param base_url: URL of the download page
+    :param parse: function called with the chunks of the ZIP file while these are downloaded, for example
+        ranges_from_zip_stream. Only called if the ZIP is downloaded from the start
+    :return: tuple (name of the ZIP file (same file name as obtained from the web site), result of parse or None)
+    """
+    print(f'Accessing numbering plan information web site at {base_url} ...')
     session = requests.Session()
-    r = session.get(BASE_URL)
+    r = session.get(base_url)
     soup = BeautifulSoup(r.text, 'lxml')
 
     # there is a form in there which we need to submit
@@ -89,29 +497,110 @@ def patterns_from_web() -> Generator[OrderedDict, None, None]:
     button = form.find('button')
     form_data[button['name']] = ''
 
-    action_url = urljoin(BASE_URL, action)
+    # conditional request for the last downloaded ZIP or range request to resume an interrupted download
+    state = read_download_state()
+    file_name = state.get('file_name')
+    validator = state.get('etag') or state.get('last_modified')
+    headers = {}
+    offset = 0
+    if file_name and state.get('complete') and os.path.isfile(file_name):
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+    elif file_name and validator and os.path.isfile(f'{file_name}.part'):
+        offset = os.path.getsize(f'{file_name}.part')
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = validator
+
+    action_url = urljoin(base_url, action)
     print('Requesting ZIP from web site...')
-    with session.post(action_url, data=form_data, stream=True) as r:
-        # write zip to temporary file and then read CSV from that temporary file
+    r = session.post(action_url, data=form_data, headers=headers, stream=True)
+    if offset and r.status_code == 206:
+        content_range = re.match(r'bytes (\d+)-', r.headers.get('content-range', ''))
+        _, params = cgi.parse_header(r.headers.get('content-disposition', ''))
+        if content_range is None or int(content_range.group(1)) != offset or \
+                params.get('filename', file_name) != file_name:
+            # the web site doesn't continue where the download was interrupted: start over
+            print(f'Web site can\'t resume download of ZIP \'{file_name}\' at {offset} bytes, restarting download...')
+            r.close()
+            os.remove(f'{file_name}.part')
+            offset = 0
+            r = session.post(action_url, data=form_data, stream=True)
+    with r:
+        if r.status_code == 304:
+            print(f'ZIP \'{file_name}\' not modified')
+            return file_name, None
+        r.raise_for_status()
         content_disposition = r.headers.get('content-disposition', '')
         _, params = cgi.parse_header(content_disposition)
-        file_name = params['filename']
-        print(f'Reading ZIP \'{file_name}’ from web site...')
-        with TemporaryFile() as temp_file:
-            for chunk in r.iter_content(chunk_size=65536):
-                temp_file.write(chunk)
-            for p in patterns_from_zip(temp_file):
-                yield p
-            temp_file.seek(0, 0)
-            with open(file_name, 'wb') as zip_file:
-                while True:
-                    chunk = temp_file.read(65536)
-                    if not chunk:
-                        break
-                    zip_file.write(chunk)
-            # for
+        if r.status_code != 206:
+            file_name = params['filename']
+        length = r.headers.get('content-length')
+        part_name = f'{file_name}.part'
+        if r.status_code == 206:
+            if not offset:
+                raise IOError(f'unexpected partial content for ZIP \'{file_name}\'')
+            print(f'Resuming download of ZIP \'{file_name}\' at {offset} bytes...')
+            mode = 'ab'
+        else:
+            print(f'Reading ZIP \'{file_name}\' from web site...')
+            offset = 0
+            mode = 'wb'
+        write_download_state(file_name, r.headers, complete=False)
+        total = offset + int(length) if length is not None else None
+        parsed = None
+        # set once all chunks are written; errors raised while downloading are re-raised even if parse caught them
+        downloaded = dict(done=False, error=None)
+        with open(part_name, mode) as zip_file, \
+                tqdm(total=total, initial=offset, unit='B', unit_scale=True, desc=file_name) as progress:
+            def chunks():
+                try:
+                    for chunk in r.iter_content(chunk_size=65536):
+                        zip_file.write(chunk)
+                        progress.update(len(chunk))
+                        yield chunk
+                    # for
+                except Exception as e:
+                    downloaded['error'] = e
+                    raise
+                downloaded['done'] = True
+
+            downloader = chunks()
+            if parse is not None and not offset:
+                # parse while downloading; parse pulls the chunks from the web site
+                try:
+                    parsed = parse(downloader)
+                except requests.exceptions.RequestException:
+                    raise
+                except Exception as e:
+                    tqdm.write(f'Failed to parse ZIP while downloading ({e}), will read the ZIP after the download')
+            # download the rest; at least the central directory of the ZIP
+            for _ in downloader:
+                pass
         # with
     # with
+    if downloaded['error'] is not None:
+        raise downloaded['error']
+    # an incomplete or broken ZIP is kept as .part (to be resumed) and never installed as snapshot
+    size = os.path.getsize(part_name)
+    if not downloaded['done'] or (total is not None and size != total):
+        raise IOError(f'download of ZIP \'{file_name}\' incomplete: {size} of {total or "?"} bytes')
+    if not zipfile.is_zipfile(part_name):
+        raise IOError(f'download of ZIP \'{file_name}\' is not a valid ZIP file ({size} bytes)')
+    os.replace(part_name, file_name)
+    write_download_state(file_name, r.headers, complete=True)
+    return file_name, parsed
+
+
+def patterns_from_web() -> Generator[OrderedDict, None, None]:
+    """
+    Read ZIP file from Mexican numbering plan authority web site and yield patterns from that ZIP
+    :return:
+    """
+    for p in patterns_from_file(zip_from_web()):
+        yield p
+    # for
     return
 
 
@@ -130,43 +619,232 @@ def patterns_from_file(zip_file_name) -> Generator[OrderedDict, None, None]:
     return
 
 
-class Pattern:
+def ranges_from_csv(lines: Iterable[str]) -> 'NumberRanges':
+    """
+    Read number ranges from the lines of a CSV file into a columnar NumberRanges object. Only the columns needed to
+    identify the ranges are kept.
+    :param lines:
+    :return:
+    """
+    with profiler.stage('csv_parse') as stage:
+        csv_reader = reader(lines)
+        header = [h.strip() for h in next(csv_reader)]
+        columns = itemgetter(*(header.index(c) for c in NumberRanges.COLUMNS))
+        rows = [columns(row) for row in csv_reader]
+        stage['items'] = len(rows)
+    with profiler.stage('columns'):
+        columns = list(zip(*rows)) or [[] for _ in NumberRanges.COLUMNS]
+        return NumberRanges.from_columns(*columns)
+
+
+def ranges_from_zip(file: RawIOBase) -> 'NumberRanges':
+    """
+    Read number ranges from 1st file (CSV) of a given ZIP file into a columnar NumberRanges object. Only the columns
+    needed to identify the ranges are read.
+    :param file:
+    :return:
+    """
+    with zipfile.ZipFile(file, mode='r') as zip_file:
+        # decompress and read the 1st file in the zip
+        file_name = zip_file.filelist[0].filename
+        print(f'Reading number ranges from {file_name}...')
+        with zip_file.open(name=file_name) as csv_file:
+            return ranges_from_csv(profiler.timed('unzip', TextIOWrapper(csv_file, encoding='utf8', newline='')))
+        # with
+    # with
+
+
+def csv_lines_from_zip_stream(chunks: Iterable[bytes]) -> Generator[str, None, None]:
+    """
+    Decompress the 1st file (CSV) of a ZIP file while the ZIP file is read sequentially, for example while it is
+    downloaded. Unlike zipfile this only needs the local file header in front of the compressed data and not the
+    central directory at the end of the ZIP file
+    :param chunks: content of the ZIP file in chunks
+    :return: generator yielding the lines of the CSV file
+    """
+    chunks = iter(chunks)
+    buffer = b''
+    # local file header: signature, version, flags, method, time, date, crc, sizes, name and extra field lengths
+    while len(buffer) < 30:
+        buffer += next(chunks)
+    signature, _, flags, method, _, _, crc, compressed_size, _, name_length, extra_length = \
+        struct.unpack('<IHHHHHIIIHH', buffer[:30])
+    if signature != 0x04034b50 or method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or flags & 0x1:
+        raise ValueError('unsupported ZIP file')
+    # with bit 3 set crc and sizes follow the data
+    data_descriptor = bool(flags & 0x8)
+    if method == zipfile.ZIP_STORED and data_descriptor:
+        raise ValueError('unsupported ZIP file')
+    while len(buffer) < 30 + name_length + extra_length:
+        buffer += next(chunks)
+    file_name = buffer[30:30 + name_length].decode('cp437')
+    tqdm.write(f'Reading number ranges from {file_name} while downloading...')
+    data = buffer[30 + name_length + extra_length:]
+
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS) if method == zipfile.ZIP_DEFLATED else None
+    remaining = None if inflater else compressed_size
+    decoder = codecs.getincrementaldecoder('utf8')()
+    crc_check = 0
+    partial_line = ''
+    while True:
+        if inflater:
+            text = inflater.decompress(data)
+            done = inflater.eof
+        else:
+            data = data[:remaining]
+            remaining -= len(data)
+            text = data
+            done = not remaining
+        crc_check = zlib.crc32(text, crc_check)
+        # split at \n only: splitlines() would also split at other line boundaries and at a \r\n spanning two chunks
+        lines = (partial_line + decoder.decode(text, final=done)).split('\n')
+        partial_line = lines.pop()
+        for line in lines:
+            yield line + '\n'
+        if done:
+            break
+        data = next(chunks, None)
+        if data is None:
+            raise ValueError('ZIP file truncated')
+    # while
+    if partial_line:
+        yield partial_line
+    if not data_descriptor and crc_check != crc:
+        raise ValueError('CRC mismatch in ZIP file')
+    return
+
+
+def ranges_from_zip_stream(chunks: Iterable[bytes]) -> 'NumberRanges':
+    """
+    Read number ranges from 1st file (CSV) of a ZIP file while the ZIP file is read sequentially
+    :param chunks: content of the ZIP file in chunks
+    :return:
+    """
+    # decompression includes waiting for the download
+    return ranges_from_csv(profiler.timed('unzip', csv_lines_from_zip_stream(chunks)))
+
+
+def ranges_from_file(zip_file_name) -> 'NumberRanges':
+    """
+    Read number ranges from 1st file (CSV) in a ZIP file on the file system
+    :param zip_file_name:
+    :return:
+    """
+    print(f'Reading number ranges from {zip_file_name}')
+    with open(zip_file_name, 'rb') as f:
+        return ranges_from_zip(f)
+
+
+# digit strings of the 1024 possible summary masks ordered like the strings
+SUMMARY_DIGITS = sorted(''.join(d for d in '0123456789' if mask >> int(d) & 1) for mask in range(1024))
+SUMMARY_MASKS = [sum(1 << int(d) for d in digits) for digits in SUMMARY_DIGITS]
+SUMMARY_RANKS = {mask: rank for rank, mask in enumerate(SUMMARY_MASKS)}
+POW10 = [10 ** i for i in range(11)]
+
+
+class Pattern(int):
+    """
+    Number range (prefix + start-end), simple pattern (prefix) or summary pattern (prefix + digits: p[357]).
+    A pattern is an integer with these bit fields (most significant first):
+        marker (1 bit), prefix padded to 10 digits (34), prefix length (4), start padded to 4 digits (14),
+        length of start and end (3), rank of the summary digits (10), end (14)
+    Digit strings padded with zeros followed by their length order like the strings ('52' < '520' < '521' < '53'),
+    hence patterns order like (prefix, start, summary) strings.
+    """
+    __slots__ = ()
 
-    def __init__(self, p, start=None, end=None):
+    def __new__(cls, p, start=None, end=None, summary=''):
+        if isinstance(p, int):
+            # unpickling
+            return super().__new__(cls, p)
         if start is None:
-            self.prefix = f'{p[" NIR"]}{p[" SERIE"]}'
-            self.start = f"{int(p[' NUMERACION_INICIAL']):04d}"
-            self.end = f"{int(p[' NUMERACION_FINAL']):04d}"
-            self.summary = ''
+            prefix = f'{p[" NIR"]}{p[" SERIE"]}'
+            start = f"{int(p[' NUMERACION_INICIAL']):04d}"
+            end = f"{int(p[' NUMERACION_FINAL']):04d}"
         else:
-            self.prefix, self.start, self.end = p, start, end
-            self.summary = ''
+            prefix = p
+
+        while end and end[-1] == '9' and start[-1] == '0':
+            end = end[:-1]
+            start = start[:-1]
+        mask = 0
+        for digit in summary:
+            mask |= 1 << int(digit)
+        return cls.from_digits(int(prefix or 0), len(prefix), int(start or 0), int(end or 0), len(start), mask)
+
+    @classmethod
+    def from_digits(cls, prefix_int, prefix_len, start_int=0, end_int=0, range_len=0, mask=0) -> 'Pattern':
+        """
+        Create a pattern from integers w/o going through digit strings. The range has to be normalized already:
+        p 1000-1999 is p 1-1
+        :param prefix_int: prefix as integer
+        :param prefix_len: number of digits of the prefix (up to 10)
+        :param start_int: start of the range
+        :param end_int: end of the range
+        :param range_len: number of digits of start and end (up to 4); 0 if this is not a range
+        :param mask: digits of a summary pattern as bit mask
+        :return:
+        """
+        if prefix_len > 10 or range_len > 4:
+            raise ValueError(f'pattern too long: {prefix_int} {start_int}-{end_int}')
+        return int.__new__(cls,
+                           1 << 79 |
+                           prefix_int * POW10[10 - prefix_len] << 45 | prefix_len << 41 |
+                           start_int * POW10[4 - range_len] << 27 | range_len << 24 |
+                           SUMMARY_RANKS[mask] << 14 | end_int)
+
+    @property
+    def prefix_len(self) -> int:
+        return self >> 41 & 0xf
+
+    @property
+    def prefix_int(self) -> int:
+        return (self >> 45 & 0x3ffffffff) // POW10[10 - (self >> 41 & 0xf)]
+
+    @property
+    def range_len(self) -> int:
+        return self >> 24 & 0x7
+
+    @property
+    def start_int(self) -> int:
+        return (self >> 27 & 0x3fff) // POW10[4 - (self >> 24 & 0x7)]
+
+    @property
+    def end_int(self) -> int:
+        return self & 0x3fff
+
+    @property
+    def mask(self) -> int:
+        return SUMMARY_MASKS[self >> 14 & 0x3ff]
+
+    @property
+    def prefix(self) -> str:
+        prefix_len = self.prefix_len
+        return f'{self.prefix_int:0{prefix_len}d}' if prefix_len else ''
+
+    @property
+    def start(self) -> str:
+        range_len = self.range_len
+        return f'{self.start_int:0{range_len}d}' if range_len else ''
 
-        while self.end and self.end[-1] == '9' and self.start[-1] == '0':
-            self.end = self.end[:-1]
-            self.start = self.start[:-1]
+    @property
+    def end(self) -> str:
+        range_len = self.range_len
+        return f'{self.end_int:0{range_len}d}' if range_len else ''
+
+    @property
+    def summary(self) -> str:
+        return SUMMARY_DIGITS[self >> 14 & 0x3ff]
 
     def __repr__(self):
-        if self.start:
+        if self.range_len:
             return f'Pattern: {self.prefix} {self.start}-{self.end}'
-        elif self.summary:
+        elif self.mask:
             return f'Pattern: {self.prefix}[{self.summary}]'
         else:
             return f'Pattern: {self.prefix}'
 
-    def __lt__(self, other):
-        return self.prefix < other.prefix or \
-               (self.prefix == other.prefix and (self.start < other.start or
-                                                 self.start == other.start and self.summary < other.summary))
-
-    def __eq__(self, other):
-        return self.prefix == other.prefix and self.start == other.start and self.end == other.end and \
-               self.summary == other.summary
-
-    def __gt__(self, other):
-        return self.prefix > other.prefix or \
-               (self.prefix == other.prefix and (self.start > other.start or
-                                                 self.start == other.start and self.summary > other.summary))
+    __str__ = __repr__
 
     @property
     def for_ucm(self):
@@ -174,42 +852,68 @@ class Pattern:
         The pattern in the format to be used in UCM
         :return:
         """
-        if self.start:
+        if self.range_len:
             r = None
-        elif self.summary:
-            r = f'{self.prefix}[{self.summary}]{"X" * (9 - len(self.prefix))}'
+        elif self.mask:
+            r = f'{self.prefix}[{self.summary}]{"X" * (9 - self.prefix_len)}'
         else:
-            r = f'{self.prefix}{"X" * (10 - len(self.prefix))}'
+            r = f'{self.prefix}{"X" * (10 - self.prefix_len)}'
         return f'\\+52{r}'
 
     @property
     def covered_numbers(self):
-        if self.start:
-            r = None
-        if self.summary:
-            r = len(self.summary) * 10 ** (9 - len(self.prefix))
+        if self.mask:
+            r = bin(self.mask).count('1') * 10 ** (9 - self.prefix_len)
         else:
-            r = 10 ** (10 - len(self.prefix))
+            r = 10 ** (10 - self.prefix_len)
         return r
 
+    @property
+    def prefixes(self) -> List[str]:
+        """
+        Prefixes of all numbers covered by a simple pattern: p[357] -> p3, p5, p7
+        :return:
+        """
+        if self.mask:
+            return [f'{self.prefix}{digit}' for digit in self.summary]
+        return [self.prefix]
+
+    def overlaps(self, other: 'Pattern') -> bool:
+        """
+        Check whether two simple patterns cover at least one common number
+        :param other:
+        :return:
+        """
+        return any(a.startswith(b) or b.startswith(a) for a in self.prefixes for b in other.prefixes)
+
+    @staticmethod
+    def from_ucm(pattern: str) -> Optional['Pattern']:
+        """
+        Parse a pattern in the format used in UCM (see for_ucm)
+        :param pattern:
+        :return: None if the pattern is not in the format created by for_ucm, for example if it doesn't cover exactly
+            10 digits
+        """
+        m = re.match(r'\\\+52(\d*)(?:\[(\d+)\])?(X*)$', pattern)
+        if m is None or len(m.group(1)) + (1 if m.group(2) else 0) + len(m.group(3)) != 10:
+            return None
+        return Pattern(m.group(1), '', '', summary=m.group(2) or '')
+
     def expand(self) -> Generator['Pattern', None, None]:
         """
         Generator of "simple" patterns. A simple pattern does not have start nor end set
         :return:
         """
-        if not self.start:
+        if not self.range_len:
             # Already simple
             yield self
             return
-        expanded = []
         # p 00-42 --> p00, p01, p02, p03, ..., p42
-        digits = len(self.start)
-        for i in range(int(self.start), int(self.end) + 1):
-            expanded.append(Pattern(f'{self.prefix}{i:0{digits}}', start='', end=''))
-
-        logging.debug(f'{self} expanded to {expanded}')
-        for p in expanded:
-            yield p
+        logging.debug('%s expands to %d patterns', self, self.end_int - self.start_int + 1)
+        base = self.prefix_int * 10 ** self.range_len
+        prefix_len = self.prefix_len + self.range_len
+        for i in range(self.start_int, self.end_int + 1):
+            yield Pattern.from_digits(base + i, prefix_len)
         return
 
     @staticmethod
@@ -234,108 +938,783 @@ class Pattern:
         """
         prefix = None
         # add a marker at the end so that the summary active at the end is pushed through
-        for pattern in chain(i, [Pattern('x' * pattern_len, '', '')]):
-            if len(pattern.prefix) != pattern_len:
-                # we don't care (yet)
-                yield pattern
-                continue
-            if pattern.summary:
-                # summary patterns can not be part of a summary
-                yield pattern
-                continue
-            if prefix is None or pattern.prefix[:-1] != prefix:
+        for pattern in chain(i, [None]):
+            if pattern is not None:
+                if pattern.prefix_len != pattern_len:
+                    # we don't care (yet)
+                    yield pattern
+                    continue
+                if pattern.mask:
+                    # summary patterns can not be part of a summary
+                    yield pattern
+                    continue
+            if pattern is None or prefix is None or pattern.prefix_int // 10 != prefix:
                 # this starts a new series of patterns to be summarized
                 if prefix is not None:
                     # eject one summary pattern
-                    if len(summary) == 1:
-                        summary_pattern = Pattern(f'{prefix}{summary}', '', '')
+                    if not mask & (mask - 1):
+                        # single digit
+                        summary_pattern = Pattern.from_digits(prefix * 10 + mask.bit_length() - 1, pattern_len)
+                    elif mask == 0x3ff:
+                        summary_pattern = Pattern.from_digits(prefix, pattern_len - 1)
                     else:
-                        summary_pattern = Pattern(prefix, '', '')
-                        if len(summary) != 10:
-                            summary_pattern.summary = summary
+                        summary_pattern = Pattern.from_digits(prefix, pattern_len - 1, mask=mask)
 
-                    if len(summarized) > 1:
-                        logging.debug(f'{summary_pattern} as summary of: {", ".join((f"{p}" for p in summarized))}')
+                    if mask & (mask - 1) and logging.getLogger().isEnabledFor(logging.DEBUG):
+                        # the summarized patterns are not kept; re-create them from the mask for the log
+                        summarized = (Pattern.from_digits(prefix * 10 + digit, pattern_len)
+                                      for digit in range(10) if mask >> digit & 1)
+                        logging.debug('%s as summary of: %s', summary_pattern, ', '.join(map(str, summarized)))
                     yield summary_pattern
+                if pattern is None:
+                    break
 
                 # start new prefix collection
-                prefix = pattern.prefix[:-1]
-                summary = pattern.prefix[-1]
-                summarized = [pattern]
+                prefix = pattern.prefix_int // 10
+                mask = 1 << pattern.prefix_int % 10
             else:
-                summary += pattern.prefix[-1]
-                summarized.append(pattern)
+                mask |= 1 << pattern.prefix_int % 10
             # if .. else ..
         # for pattern ..
         return
 
 
-def assert_partition(axl, name, read_only=True):
+class PatternTrie:
     """
-    assert existence of partition w/ given name
-    :param axl: AXL helper object
-    :param name: partition name
-    :param read_only: True=read only access to UCM
-    :return: UUID of partition
+    10-ary digit trie of number ranges. Ranges are inserted w/o expanding them to individual patterns. Each node is a
+    dict digit -> child node; a child of True marks a fully covered sub tree.
     """
-    p = axl.get_route_partition(name=name)
-    if p is not None:
-        r = p['uuid']
-        print(f'Partition {name} exists.')
-    else:
-        print(f'Partition {name} does not exist.')
-        if read_only:
-            r = None
-        else:
-            r = axl.add_route_partition(name=name)
-            print(f'Partition {name} created.')
-    return r
+    FULL = True
 
+    def __init__(self, min_prefix_len=2):
+        """
+        :param min_prefix_len: shortest prefix a summary pattern can have
+        """
+        self.root = {}
+        self.min_prefix_len = min_prefix_len
 
-def all_zips() -> List[str]:
+    def add(self, pattern: Pattern):
+        """
+        Add a pattern (range or summary pattern) to the trie
+        :param pattern:
+        :return:
+        """
+        if pattern.summary:
+            # p[357] -> p3, p5, p7
+            for digit in pattern.summary:
+                self.add(Pattern(f'{pattern.prefix}{digit}', '', ''))
+            return
+        node = self.root
+        for digit in pattern.prefix[:-1]:
+            child = node.get(digit)
+            if child is self.FULL:
+                # already covered
+                return
+            if child is None:
+                child = node[digit] = {}
+            node = child
+        # for
+        last = pattern.prefix[-1]
+        self._add_range(node, f'{last}{pattern.start}', f'{last}{pattern.end}')
+
+    def remove(self, prefix):
+        """
+        Remove everything covered by a given prefix from the trie. Fully covered nodes on the way are split up
+        :param prefix:
+        :return:
+        """
+        node = self.root
+        for digit in prefix[:-1]:
+            child = node.get(digit)
+            if child is None:
+                return
+            if child is self.FULL:
+                child = node[digit] = dict.fromkeys('0123456789', self.FULL)
+            node = child
+        # for
+        node.pop(prefix[-1], None)
+
+    def _add_range(self, node, start, end):
+        """
+        Add range start-end (digit strings of same length) below given node
+        :param node:
+        :param start:
+        :param end:
+        :return:
+        """
+        first, last = start[0], end[0]
+        rest = len(start) - 1
+        if first == last:
+            if node.get(first) is self.FULL:
+                return
+            if not rest or (start[1:] == '0' * rest and end[1:] == '9' * rest):
+                node[first] = self.FULL
+                return
+            child = node.get(first)
+            if child is None:
+                child = node[first] = {}
+            self._add_range(child, start[1:], end[1:])
+            return
+        # p 3xx-6yy -> p 3xx-399, p4, p5, p 600-6yy
+        self._add_range(node, start, f'{first}{"9" * rest}')
+        for digit in range(int(first) + 1, int(last)):
+            node[str(digit)] = self.FULL
+        self._add_range(node, f'{last}{"0" * rest}', end)
+        return
+
+    def _collapse(self, node, prefix) -> Tuple[bool, List[Pattern]]:
+        """
+        Bottom-up collapse of the sub tree below given node
+        :param node:
+        :param prefix: prefix represented by node
+        :return: tuple (node fully covered, sorted list of patterns covering the sub tree)
+        """
+        full = ''
+        children: List[Tuple[str, List[Pattern]]] = []
+        for digit in '0123456789':
+            child = node.get(digit)
+            if child is None:
+                continue
+            if child is not self.FULL:
+                child_full, child_patterns = self._collapse(child, f'{prefix}{digit}')
+                if not child_full:
+                    children.append((digit, child_patterns))
+                    continue
+            full += digit
+        # for
+
+        if len(prefix) < self.min_prefix_len:
+            # no summarization this close to the root
+            children.extend((digit, [Pattern(f'{prefix}{digit}', '', '')]) for digit in full)
+            children.sort(key=lambda c: c[0])
+            return False, [p for _, patterns in children for p in patterns]
+
+        if len(full) == 10:
+            return True, []
+
+        patterns = []
+        if len(full) == 1:
+            children.append((full, [Pattern(f'{prefix}{full}', '', '')]))
+            children.sort(key=lambda c: c[0])
+        elif full:
+            patterns.append(Pattern(prefix, '', '', summary=full))
+        patterns.extend(p for _, child_patterns in children for p in child_patterns)
+        return False, patterns
+
+    def patterns(self) -> List[Pattern]:
+        """
+        Minimal sorted list of patterns covering all ranges in the trie
+        :return:
+        """
+        full, patterns = self._collapse(self.root, '')
+        assert not full
+        return patterns
+
+
+class NumberRanges:
     """
-    Get a list of ZIP files in the current directory sorted from latest to oldest
-    :return:
+    Columnar representation of the number ranges of a numbering plan. Ranges are kept in NumPy arrays and the network
+    type (TIPO_RED) is categorical: an array of codes indexing into the list of network types.
     """
-    re_zip = re.compile(r'pnn_Publico_\d{2}_\d{2}_\d{4}.zip')
-    zip_files = os.listdir()
-    zip_files = [f for f in zip_files if re_zip.match(f) and os.path.isfile(f)]
+    # columns read from the CSV
+    COLUMNS = ['NIR', 'SERIE', 'NUMERACION_INICIAL', 'NUMERACION_FINAL', 'TIPO_RED']
 
-    # sort files: why are the file names in dd_mm_yyyy? Just to make sorting harder?
-    zip_files.sort(key=lambda x: f'{x[-8:-4]}{x[-11:-9]}{x[-14:-12]}', reverse=True)
-    return zip_files
+    # per range arrays
+    ARRAYS = ['nir', 'serie', 'prefix', 'start', 'end', 'network_type']
 
+    # in the closed 10 digit numbering plan NIR + SERIE always have 6 digits followed by 4 digits
+    PREFIX_DIGITS = 6
+    LINE_DIGITS = 4
 
-def optimize_patterns(patterns: Iterable) -> List[Pattern]:
-    # we only want the mobile patterns
-    patterns = [Pattern(p) for p in patterns if p[' TIPO_RED'] == 'MOVIL']
+    # number of ranges converted to Python objects at a time when iterating
+    BLOCK_SIZE = 4096
 
-    print(f'got {len(patterns)} mobile patterns')
+    def __init__(self, nir, serie, prefix, start, end, network_type, network_types: List[str]):
+        """
+        :param nir: NIR
+        :param serie: SERIE
+        :param prefix: NIR and SERIE combined to a 6 digit prefix
+        :param start: NUMERACION_INICIAL
+        :param end: NUMERACION_FINAL
+        :param network_type: codes of the network type of each range
+        :param network_types: network types the codes refer to
+        """
+        self.nir, self.serie, self.prefix = nir, serie, prefix
+        self.start, self.end = start, end
+        self.network_type, self.network_types = network_type, network_types
 
-    print('sorting patterns...')
-    patterns.sort()
+    @staticmethod
+    def from_columns(nir, serie, start, end, network_type) -> 'NumberRanges':
+        """
+        Create number ranges from columns of strings as read from the CSV
+        :param nir:
+        :param serie:
+        :param start:
+        :param end:
+        :param network_type:
+        :return:
+        """
+        nir = np.array(nir, dtype=str)
+        nir_digits = np.char.str_len(nir)
+        nir = nir.astype(np.int64)
+        serie = np.array(serie, dtype=str).astype(np.int64)
+        prefix = nir * 10 ** (NumberRanges.PREFIX_DIGITS - nir_digits) + serie
+        network_types, network_type = np.unique(np.array(network_type, dtype=str), return_inverse=True)
+        return NumberRanges(nir=nir, serie=serie, prefix=prefix,
+                            start=np.array(start, dtype=str).astype(np.int64),
+                            end=np.array(end, dtype=str).astype(np.int64),
+                            network_type=network_type.astype(np.int8),
+                            network_types=network_types.tolist())
 
-    # consolidate mobile ranges
-    print('expanding patterns...')
-    patterns = [p for p in Pattern.expand_patterns(patterns)]
-    print(f'expanded to {len(patterns)} patterns')
-
-    for pattern_len in range(10, 2, -1):
-        before = len(patterns)
-        patterns.sort()
-        patterns = [p for p in Pattern.summarize(patterns, pattern_len)]
-        print(f'Summarize {pattern_len}: {before}->{len(patterns)}')
-    return patterns
+    @staticmethod
+    def from_arrays(arrays) -> 'NumberRanges':
+        """
+        Create number ranges from a mapping of arrays as returned by arrays()
+        :param arrays:
+        :return:
+        """
+        return NumberRanges(network_types=arrays['network_types'].tolist(),
+                            **{a: arrays[a] for a in NumberRanges.ARRAYS})
 
+    def arrays(self) -> dict:
+        """
+        All arrays of the number ranges; for example to save them with numpy.savez()
+        :return:
+        """
+        arrays = {a: getattr(self, a) for a in self.ARRAYS}
+        arrays['network_types'] = np.array(self.network_types, dtype=str)
+        return arrays
 
-def list_compare(old: List, new: List) -> Tuple[List, List]:
-    """
-    Compare two sorted list and return tuple of two lists:
-        1: deleted; entries in old but not in new
-        2: addwed: entries in in new but not in old
+    def __len__(self):
+        return len(self.prefix)
 
-    :param old: sorted list of entrires (the old ones)
-    :param new: sorted list of entriues (the new ones)
+    def __getitem__(self, item) -> 'NumberRanges':
+        """
+        Subset of the ranges selected by a boolean mask or index array
+        :param item:
+        :return:
+        """
+        return NumberRanges(nir=self.nir[item], serie=self.serie[item], prefix=self.prefix[item],
+                            start=self.start[item], end=self.end[item],
+                            network_type=self.network_type[item], network_types=self.network_types)
+
+    def of_network_type(self, network_type) -> 'NumberRanges':
+        """
+        Ranges of a given network type
+        :param network_type: for example 'MOVIL'
+        :return:
+        """
+        if network_type not in self.network_types:
+            return self[np.zeros(len(self), dtype=bool)]
+        return self[self.network_type == self.network_types.index(network_type)]
+
+    def patterns(self) -> Generator[Pattern, None, None]:
+        """
+        Yield a Pattern for each range. Normalization of the ranges (p 1000-1999 -> p 1-1) is vectorized
+        :return:
+        """
+        start, end = self.start, self.end
+        digits = np.full(len(self), self.LINE_DIGITS)
+        for _ in range(self.LINE_DIGITS):
+            strip = (digits > 0) & (start % 10 == 0) & (end % 10 == 9)
+            start = np.where(strip, start // 10, start)
+            end = np.where(strip, end // 10, end)
+            digits = digits - strip
+        # for
+        # convert to Python ints block by block so that consumers can stream w/o holding lists for all ranges
+        for i in range(0, len(self), self.BLOCK_SIZE):
+            block = slice(i, i + self.BLOCK_SIZE)
+            for prefix, s, e, d in zip(self.prefix[block].tolist(), start[block].tolist(), end[block].tolist(),
+                                       digits[block].tolist()):
+                if d:
+                    yield Pattern.from_digits(prefix, self.PREFIX_DIGITS, s, e, d)
+                else:
+                    yield Pattern.from_digits(prefix, self.PREFIX_DIGITS)
+            # for
+        # for
+        return
+
+
+class Classification(NamedTuple):
+    """
+    Classification of a number by the numbering plan
+    """
+    network_type: str
+    nir: str
+    carrier: str
+    state: str
+
+
+class NumberClassifier:
+    """
+    Lookup of the network type (MOVIL/FIJO), NIR, carrier (RAZON_SOCIAL) and state (ESTADO) of 10 digit numbers.
+    The ranges are compiled to sorted int64 arrays of the first and last number of each range; batches of numbers are
+    classified with a vectorized binary search. Attributes are categorical: per range codes indexing into lists of
+    values. Each code array has an additional last entry for numbers not covered by any range
+    """
+    # columns read from the CSV
+    COLUMNS = ['NIR', 'SERIE', 'NUMERACION_INICIAL', 'NUMERACION_FINAL', 'TIPO_RED', 'RAZON_SOCIAL', 'ESTADO']
+
+    # attributes of a classification with the CSV columns they are taken from
+    ATTRIBUTES = OrderedDict([('network_type', 'TIPO_RED'), ('nir', 'NIR'), ('carrier', 'RAZON_SOCIAL'),
+                              ('state', 'ESTADO')])
+
+    NUMBER_DIGITS = NumberRanges.PREFIX_DIGITS + NumberRanges.LINE_DIGITS
+
+    def __init__(self, first: np.ndarray, last: np.ndarray, codes: Dict[str, np.ndarray],
+                 values: Dict[str, List[str]]):
+        """
+        :param first: sorted first numbers of the ranges
+        :param last: last numbers of the ranges
+        :param codes: per attribute: codes of the ranges with an additional last code for uncovered numbers
+        :param values: per attribute: list of values the codes index into; the last value is ''
+        """
+        self.first = first
+        self.last = last
+        self.codes = codes
+        self.values = values
+        # values as NumPy arrays to translate codes of batches
+        self.value_arrays = {a: np.array(v, dtype=str) for a, v in values.items()}
+        # Python lists for single lookups
+        self.first_list = first.tolist()
+        self.last_list = last.tolist()
+        self.code_lists = {a: c.tolist() for a, c in codes.items()}
+
+    @classmethod
+    def from_columns(cls, nir, serie, start, end, attributes: Dict[str, list]) -> 'NumberClassifier':
+        """
+        Compile ranges given as columns of strings as read from the CSV. Numbers covered by several ranges are
+        classified by the range which comes last in the input. Adjacent ranges with identical attributes are merged
+        :param nir:
+        :param serie:
+        :param start:
+        :param end:
+        :param attributes: per attribute in ATTRIBUTES: column of values
+        :return:
+        """
+        ranges = NumberRanges.from_columns(nir, serie, start, end, attributes['network_type'])
+        line = 10 ** NumberRanges.LINE_DIGITS
+        first = ranges.prefix * line + ranges.start
+        last = ranges.prefix * line + ranges.end
+        values, codes = {}, {}
+        for attribute, column in attributes.items():
+            v, c = np.unique(np.array(column, dtype=str), return_inverse=True)
+            values[attribute] = v.tolist()
+            codes[attribute] = c.astype(np.int32)
+        # for
+        order = np.argsort(first, kind='stable')
+        overlaps = int(np.count_nonzero(first[order][1:] <= last[order][:-1]))
+        if overlaps:
+            logging.warning(f'{overlaps} overlapping number ranges; numbers covered by several ranges are classified '
+                            f'by the range which comes last in the input')
+            first, last, codes = cls.resolve_overlaps(first, last, codes)
+        else:
+            first, last = first[order], last[order]
+            codes = {a: c[order] for a, c in codes.items()}
+
+        # merge ranges which continue the previous range with identical attributes
+        merge = (first[1:] == last[:-1] + 1)
+        for c in codes.values():
+            merge &= c[1:] == c[:-1]
+        # the 1st range is always kept; no ranges: nothing to keep
+        keep = np.concatenate((np.ones(min(len(first), 1), dtype=bool), ~merge))
+        # last number of a merged range: last number of the last range merged into it, i.e. the range before the next
+        # kept range or the last range
+        group_end = np.flatnonzero(np.append(keep[1:], len(first) > 0))
+        first, last = first[keep], last[group_end]
+        for attribute in codes:
+            values[attribute].append('')
+            codes[attribute] = np.append(codes[attribute][keep], np.int32(len(values[attribute]) - 1))
+        # for
+        return cls(first=first, last=last, codes=codes, values=values)
+
+    @staticmethod
+    def resolve_overlaps(first: np.ndarray, last: np.ndarray,
+                         codes: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Split overlapping ranges into non-overlapping ranges. Each number is attributed to the last range in input
+        order covering it
+        :param first: first numbers of the ranges in input order
+        :param last: last numbers of the ranges
+        :param codes: per attribute: codes of the ranges
+        :return: tuple (first, last, codes) of sorted, non-overlapping ranges
+        """
+        # elementary intervals between all range boundaries
+        bounds = np.unique(np.concatenate((first, last + 1)))
+        lo = np.searchsorted(bounds, first)
+        hi = np.searchsorted(bounds, last + 1)
+        # later ranges overwrite earlier ones
+        owner = np.full(len(bounds) - 1, -1, dtype=np.int64)
+        for i, (l, h) in enumerate(zip(lo.tolist(), hi.tolist())):
+            owner[l:h] = i
+        # for
+        covered = owner >= 0
+        owner = owner[covered]
+        return bounds[:-1][covered], bounds[1:][covered] - 1, {a: c[owner] for a, c in codes.items()}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict]) -> 'NumberClassifier':
+        """
+        Compile rows as read by patterns_from_zip()
+        :param rows:
+        :return:
+        """
+        columns = {c: [] for c in cls.COLUMNS}
+        keys = None
+        for row in rows:
+            if keys is None:
+                # column names in the CSV header have leading blanks
+                stripped = {k.strip(): k for k in row if k is not None}
+                keys = [(columns[c], stripped[c]) for c in cls.COLUMNS]
+            for column, key in keys:
+                column.append(row[key])
+        # for
+        return cls.from_columns(columns['NIR'], columns['SERIE'], columns['NUMERACION_INICIAL'],
+                                columns['NUMERACION_FINAL'], {a: columns[c] for a, c in cls.ATTRIBUTES.items()})
+
+    @classmethod
+    def from_file(cls, zip_file_name) -> 'NumberClassifier':
+        """
+        Compile the ranges of a ZIP file
+        :param zip_file_name:
+        :return:
+        """
+        return cls.from_rows(patterns_from_file(zip_file_name))
+
+    def __len__(self):
+        return len(self.first)
+
+    @classmethod
+    def number(cls, number: Union[str, int]) -> int:
+        """
+        10 digit national number as integer. Non-digits are ignored; of longer numbers (for example with country
+        code) the last 10 digits are used
+        :param number: for example '+52 55 1234 5678'
+        :return:
+        """
+        if isinstance(number, int):
+            return number % 10 ** cls.NUMBER_DIGITS
+        digits = ''.join(d for d in number if d.isdigit())
+        return int(digits[-cls.NUMBER_DIGITS:] or 0)
+
+    def lookup(self, numbers) -> np.ndarray:
+        """
+        Ranges covering a batch of numbers
+        :param numbers: array like of 10 digit numbers as integers
+        :return: index of the range covering each number; -1 if a number is not covered
+        """
+        numbers = np.asarray(numbers, dtype=np.int64)
+        if not len(self.first):
+            return np.full(numbers.shape, -1, dtype=np.intp)
+        index = np.searchsorted(self.first, numbers, side='right') - 1
+        # index -1 wraps around to the last range which can't cover numbers smaller than the first range
+        covered = numbers <= self.last[index]
+        return np.where(covered & (index >= 0), index, -1)
+
+    def classify(self, number: Union[str, int]) -> Optional[Classification]:
+        """
+        Classify a single number
+        :param number: 10 digit number as string or integer; see number()
+        :return: None if the number is not covered by any range
+        """
+        number = self.number(number)
+        i = bisect_right(self.first_list, number) - 1
+        if i < 0 or number > self.last_list[i]:
+            return None
+        return Classification(**{a: self.values[a][self.code_lists[a][i]] for a in self.ATTRIBUTES})
+
+    def classify_batch(self, numbers) -> Dict[str, np.ndarray]:
+        """
+        Classify a batch of numbers
+        :param numbers: array like of 10 digit numbers as integers
+        :return: per attribute (see ATTRIBUTES) an array of values; '' for numbers not covered by any range
+        """
+        index = self.lookup(numbers)
+        return {a: self.value_arrays[a][self.codes[a][index]] for a in self.ATTRIBUTES}
+
+    def codes_batch(self, numbers) -> Dict[str, np.ndarray]:
+        """
+        Classify a batch of numbers w/o translating codes to values; faster than classify_batch()
+        :param numbers: array like of 10 digit numbers as integers
+        :return: per attribute (see ATTRIBUTES) an array of codes indexing into values[attribute]. The last code of
+            each attribute is used for numbers not covered by any range
+        """
+        index = self.lookup(numbers)
+        return {a: self.codes[a][index] for a in self.ATTRIBUTES}
+
+
+def assert_partition(axl, name, read_only=True, echo=print):
+    """
+    assert existence of partition w/ given name
+    :param axl: AXL helper object
+    :param name: partition name
+    :param read_only: True=read only access to UCM
+    :param echo: function to print messages
+    :return: UUID of partition
+    """
+    p = axl.get_route_partition(name=name)
+    if p is not None:
+        r = p['uuid']
+        echo(f'Partition {name} exists.')
+    else:
+        echo(f'Partition {name} does not exist.')
+        if read_only:
+            r = None
+        else:
+            r = axl.add_route_partition(name=name)
+            echo(f'Partition {name} created.')
+    return r
+
+
+def all_zips() -> List[str]:
+    """
+    Get a list of ZIP files in the current directory sorted from latest to oldest
+    :return:
+    """
+    re_zip = re.compile(r'pnn_Publico_\d{2}_\d{2}_\d{4}.zip')
+    zip_files = os.listdir()
+    zip_files = [f for f in zip_files if re_zip.match(f) and os.path.isfile(f)]
+
+    zip_files.sort(key=zip_date, reverse=True)
+    return zip_files
+
+
+def zip_date(zip_file_name) -> str:
+    """
+    Date of a pnn_Publico_dd_mm_yyyy.zip file as yyyymmdd
+    :param zip_file_name:
+    :return:
+    """
+    # why are the file names in dd_mm_yyyy? Just to make sorting harder?
+    x = zip_file_name
+    return f'{x[-8:-4]}{x[-11:-9]}{x[-14:-12]}'
+
+
+def optimize_patterns(patterns: Union[Iterable, NumberRanges]) -> List[Pattern]:
+    """
+    Summarize the mobile ranges to a minimal set of patterns. The ranges are streamed into the trie; neither the ranges
+    nor the individual numbers they cover are materialized
+    :param patterns: either rows as read by patterns_from_zip() or NumberRanges as read by ranges_from_zip()
+    :return: sorted list of patterns
+    """
+    # we only want the mobile patterns
+    if isinstance(patterns, NumberRanges):
+        with profiler.stage('filter') as stage:
+            mobile = patterns.of_network_type('MOVIL')
+            stage['items'] = len(mobile)
+        patterns = mobile.patterns()
+    else:
+        patterns = (Pattern(p) for p in profiler.timed('csv_parse', patterns) if p[' TIPO_RED'] == 'MOVIL')
+
+    # consolidate mobile ranges
+    print('summarizing patterns...')
+    with profiler.stage('trie') as stage:
+        trie = PatternTrie()
+        count = 0
+        for count, pattern in enumerate(patterns, 1):
+            trie.add(pattern)
+        stage['items'] = count
+    print(f'got {count} mobile patterns')
+    with profiler.stage('collapse') as stage:
+        patterns = trie.patterns()
+        stage['items'] = len(patterns)
+    return patterns
+
+
+def changed_prefixes(old: NumberRanges, new: NumberRanges) -> np.ndarray:
+    """
+    Determine the prefixes (NIR + SERIE) for which the mobile ranges differ between two sets of number ranges
+    :param old:
+    :param new:
+    :return: sorted array of prefixes
+    """
+    def keys(ranges: NumberRanges):
+        # prefix, start and end combined to a single sortable key: ppppppsssseeee
+        ranges = ranges.of_network_type('MOVIL')
+        line = 10 ** NumberRanges.LINE_DIGITS
+        return (ranges.prefix * line + ranges.start) * line + ranges.end
+
+    changed = np.setxor1d(keys(old), keys(new))
+    return np.unique(changed // 10 ** (2 * NumberRanges.LINE_DIGITS))
+
+
+def optimize_patterns_incremental(ranges: NumberRanges, previous_ranges: NumberRanges,
+                                  previous_patterns: List[Pattern]) -> List[Pattern]:
+    """
+    Summarize the mobile ranges to a minimal set of patterns based on the optimized patterns of a previous snapshot.
+    Only the prefixes (NIR + SERIE) with changed mobile ranges are summarized from the number ranges; everything else is
+    taken from the previous patterns. The result is identical to optimize_patterns(ranges)
+    :param ranges: number ranges
+    :param previous_ranges: number ranges of the previous snapshot
+    :param previous_patterns: optimized patterns of the previous snapshot
+    :return: sorted list of patterns
+    """
+    with profiler.stage('filter') as stage:
+        changed = changed_prefixes(previous_ranges, ranges)
+        mobile = ranges[np.isin(ranges.prefix, changed)].of_network_type('MOVIL')
+        stage['items'] = len(mobile)
+    print(f'{len(changed)} prefixes with changed mobile ranges')
+
+    with profiler.stage('trie') as stage:
+        trie = PatternTrie()
+        for pattern in previous_patterns:
+            trie.add(pattern)
+        for prefix in changed.tolist():
+            trie.remove(f'{prefix:0{NumberRanges.PREFIX_DIGITS}d}')
+        for pattern in mobile.patterns():
+            trie.add(pattern)
+        stage['items'] = len(previous_patterns) + len(mobile)
+    with profiler.stage('collapse') as stage:
+        patterns = trie.patterns()
+        stage['items'] = len(patterns)
+    return patterns
+
+
+def cache_file_name(zip_file_name) -> str:
+    """
+    Name of the cache file for a given ZIP file: pnn_Publico_13_05_2019.zip -> pnn_Publico_13_05_2019.npz
+    :param zip_file_name:
+    :return:
+    """
+    return f'{os.path.splitext(zip_file_name)[0]}.npz'
+
+
+def file_sha256(file_name) -> str:
+    """
+    SHA-256 of a file's content
+    :param file_name:
+    :return: hex digest
+    """
+    sha256 = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, 65536), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def read_cache(zip_file_name, with_ranges=True) -> Optional[Tuple[Optional[NumberRanges], List[Pattern]]]:
+    """
+    Read number ranges and optimized patterns of a ZIP file from the cache file next to the ZIP file
+    :param zip_file_name:
+    :param with_ranges: False: only read the optimized patterns; number ranges are returned as None
+    :return: None if the cache file does not exist or does not belong to the current content of the ZIP file
+    """
+    file_name = cache_file_name(zip_file_name)
+    if not os.path.isfile(file_name):
+        return None
+    try:
+        with np.load(file_name, allow_pickle=False) as cache:
+            if int(cache['version']) != CACHE_VERSION or str(cache['sha256']) != file_sha256(zip_file_name):
+                logging.debug(f'{file_name} is stale')
+                return None
+            ranges = NumberRanges.from_arrays(cache) if with_ranges else None
+            patterns = []
+            for prefix, summary in zip(cache['pattern_prefix'].tolist(), cache['pattern_summary'].tolist()):
+                patterns.append(Pattern(prefix, '', '', summary=summary))
+            # for
+        # with
+    except (OSError, KeyError, ValueError) as e:
+        logging.warning(f'Failed to read cache {file_name}: {e}')
+        return None
+    print(f'Read {len(patterns)} patterns from {file_name}')
+    return ranges, patterns
+
+
+def write_cache(zip_file_name, ranges: NumberRanges, patterns: List[Pattern]):
+    """
+    Write number ranges and optimized patterns of a ZIP file to the cache file next to the ZIP file
+    :param zip_file_name:
+    :param ranges:
+    :param patterns:
+    :return:
+    """
+    file_name = cache_file_name(zip_file_name)
+    temp_file_name = f'{file_name}.tmp'
+    with open(temp_file_name, 'wb') as f:
+        np.savez_compressed(f,
+                            version=CACHE_VERSION,
+                            sha256=file_sha256(zip_file_name),
+                            pattern_prefix=np.array([p.prefix for p in patterns], dtype=str),
+                            pattern_summary=np.array([p.summary for p in patterns], dtype=str),
+                            **ranges.arrays())
+    # with
+    os.replace(temp_file_name, file_name)
+    print(f'Cached number ranges and patterns in {file_name}')
+    return
+
+
+def previous_snapshot(zip_file_name) -> Optional[Tuple[NumberRanges, List[Pattern]]]:
+    """
+    Cached number ranges and optimized patterns of the latest snapshot older than the given ZIP file
+    :param zip_file_name:
+    :return: None if no older snapshot with a valid cache exists
+    """
+    date = zip_date(zip_file_name)
+    for previous in all_zips():
+        if zip_date(previous) >= date:
+            continue
+        cached = read_cache(previous)
+        if cached is not None:
+            return cached
+    # for
+    return None
+
+
+def load_snapshot(zip_file_name, use_cache=True, rebuild_cache=False, incremental=False,
+                  with_ranges=True, ranges=None) -> Tuple[Optional[NumberRanges], List[Pattern]]:
+    """
+    Number ranges and optimized patterns of a ZIP file. If possible these are read from the cache file next to the
+    ZIP file. Else the ZIP file is parsed, the patterns are optimized and the cache file is updated
+    :param zip_file_name:
+    :param use_cache: False: don't read or write the cache
+    :param rebuild_cache: True: ignore an existing cache file and write a new one
+    :param incremental: True: optimize based on the cached patterns of the previous snapshot if available
+    :param with_ranges: False: number ranges are not needed and can be returned as None
+    :param ranges: number ranges of the ZIP file if already read while downloading the ZIP
+    :return: tuple (number ranges, optimized patterns)
+    """
+    if ranges is None:
+        if use_cache and not rebuild_cache:
+            with profiler.stage('read_cache'):
+                cached = read_cache(zip_file_name, with_ranges=with_ranges)
+            if cached is not None:
+                return cached
+        ranges = ranges_from_file(zip_file_name)
+    previous = use_cache and incremental and previous_snapshot(zip_file_name)
+    if previous:
+        patterns = optimize_patterns_incremental(ranges, *previous)
+    else:
+        patterns = optimize_patterns(ranges)
+    if use_cache:
+        with profiler.stage('write_cache'):
+            write_cache(zip_file_name, ranges, patterns)
+    return ranges, patterns
+
+
+def snapshot_patterns(zip_file_name, parsed_args, ranges=None) -> List[Pattern]:
+    """
+    Optimized patterns of a ZIP file honoring the --columnar, --nocache, --rebuildcache and --incremental options
+    :param zip_file_name:
+    :param parsed_args:
+    :param ranges: number ranges of the ZIP file if already read while downloading the ZIP
+    :return:
+    """
+    if parsed_args.nocache and not parsed_args.columnar and ranges is None:
+        return optimize_patterns(patterns_from_file(zip_file_name))
+    _, patterns = load_snapshot(zip_file_name, use_cache=not parsed_args.nocache,
+                                rebuild_cache=parsed_args.rebuildcache, incremental=parsed_args.incremental,
+                                with_ranges=False, ranges=ranges)
+    return patterns
+
+
+def list_compare(old: List, new: List) -> Tuple[List, List]:
+    """
+    Compare two sorted list and return tuple of two lists:
+        1: deleted; entries in old but not in new
+        2: addwed: entries in in new but not in old
+
+    :param old: sorted list of entrires (the old ones)
+    :param new: sorted list of entriues (the new ones)
     :return: tuple of two lists: deleted entries, added entries
     """
     added, deleted = [], []
@@ -364,51 +1743,904 @@ def list_compare(old: List, new: List) -> Tuple[List, List]:
     return deleted, added
 
 
+def print_comparison(old_name, old_patterns: List[Pattern], new_name, new_patterns: List[Pattern],
+                     dump_patterns=False):
+    """
+    Print the differences between the optimized patterns of two snapshots
+    :param old_name: name of the old snapshot
+    :param old_patterns: sorted optimized patterns of the old snapshot
+    :param new_name: name of the new snapshot
+    :param new_patterns: sorted optimized patterns of the new snapshot
+    :param dump_patterns: True: print added and removed patterns
+    :return:
+    """
+    print(f'{old_name} vs. {new_name}')
+    patterns_deleted, patterns_added = list_compare(old_patterns, new_patterns)
+    p: Pattern
+    print(f'  {old_name}: {len(old_patterns)} patterns covering {sum(p.covered_numbers for p in old_patterns):,} numbers')
+    print(f'  {new_name}: {len(new_patterns)} patterns covering {sum(p.covered_numbers for p in new_patterns):,} numbers')
+    print(f'  {len(patterns_added)} patterns added')
+    print(f'  {len(patterns_deleted)} patterns deleted')
+    if dump_patterns:
+        changes: List[Tuple[Pattern, str]] = []
+        changes.extend(((p, '  added') for p in patterns_added))
+        changes.extend(((p, 'removed') for p in patterns_deleted))
+        # sort on the 1st element of the tuple: the pattern
+        changes.sort(key=lambda x: x[0])
+        if changes:
+            print('\n'.join((f'  {c[1]} {c[0].for_ucm}' for c in changes)))
+    # if
+    return
+
+
 def pattern_analysis(parsed_args):
-    # read all CSVs
-    all_patterns: List[Tuple[str, List[Pattern]]] = []
-    for zip_name in all_zips():
-        print(f'{zip_name}')
-        patterns = patterns_from_zip(zip_name)
-        patterns = optimize_patterns(patterns)
-        all_patterns.append((zip_name, patterns))
-
-    all_patterns.reverse()
+    # read all CSVs. Optimized patterns of snapshots seen before are read from the cache
+    # oldest first so that each snapshot can be optimized incrementally based on the previous one
+    zip_names = list(reversed(all_zips()))
+    all_patterns: List[Tuple[str, List[Pattern]]]
+    if parsed_args.jobs == 1:
+        all_patterns = [(zip_name, snapshot_patterns(zip_name, parsed_args)) for zip_name in zip_names]
+    else:
+        # snapshots are independent of each other; results are gathered in date order
+        with ProcessPoolExecutor(max_workers=parsed_args.jobs or None) as executor:
+            all_patterns = list(zip(zip_names,
+                                    executor.map(snapshot_patterns, zip_names, repeat(parsed_args))))
+        # with
+
     for i in range(len(all_patterns) - 1):
-        old_name = all_patterns[i][0]
-        new_name = all_patterns[i + 1][0]
-        old_patterns = all_patterns[i][1]
-        new_patterns = all_patterns[i + 1][1]
-
-        print(f'{old_name} vs. {new_name}')
-        patterns_deleted, patterns_added = list_compare(old_patterns, new_patterns)
-        p: Pattern
-        print(f'  {old_name}: {len(old_patterns)} patterns covering {sum(p.covered_numbers for p in old_patterns):,} numbers')
-        print(f'  {new_name}: {len(new_patterns)} patterns covering {sum(p.covered_numbers for p in new_patterns):,} numbers')
-        print(f'  {len(patterns_added)} patterns added')
-        print(f'  {len(patterns_deleted)} patterns deleted')
-        if parsed_args.patterns:
-            changes: List[Tuple[Pattern, str]] = []
-            changes.extend(((p, '  added') for p in patterns_added))
-            changes.extend(((p, 'removed') for p in patterns_deleted))
-            # sort on the 1st element of the tuple: the pattern
-            changes.sort(key=lambda x: x[0])
-            if changes:
-                print('\n'.join((f'  {c[1]} {c[0].for_ucm}' for c in changes)))
-        # if
+        old_name, old_patterns = all_patterns[i]
+        new_name, new_patterns = all_patterns[i + 1]
+        print_comparison(old_name, old_patterns, new_name, new_patterns, dump_patterns=parsed_args.patterns)
+    # for
+    return
+
+
+def snapshot_file_name(name) -> str:
+    """
+    Name of the ZIP file of a snapshot given by file name (w/ or w/o .zip) or by date (dd_mm_yyyy)
+    :param name:
+    :return:
+    """
+    if re.match(r'\d{2}_\d{2}_\d{4}$', name):
+        name = f'pnn_Publico_{name}'
+    if not name.endswith('.zip'):
+        name = f'{name}.zip'
+    return name
+
+
+def snapshot_diff(parsed_args):
+    """
+    Compare the optimized patterns of two snapshots given by --diff
+    :param parsed_args:
+    :return:
+    """
+    old_name, new_name = (snapshot_file_name(n) for n in parsed_args.diff)
+    for name in (old_name, new_name):
+        if not os.path.isfile(name):
+            print(f'{name} does not exist')
+            exit(2)
+    old_patterns = snapshot_patterns(old_name, parsed_args)
+    new_patterns = snapshot_patterns(new_name, parsed_args)
+    print_comparison(old_name, old_patterns, new_name, new_patterns, dump_patterns=parsed_args.patterns)
+    return
+
+
+# classifier of the CDR worker processes; set by cdr_worker_init()
+cdr_classifier: Optional[NumberClassifier] = None
+
+
+def cdr_worker_init(classifier: NumberClassifier):
+    """
+    Initializer of the CDR worker processes: the classifier is transferred once per process and not with each chunk
+    :param classifier:
+    :return:
+    """
+    global cdr_classifier
+    cdr_classifier = classifier
+
+
+def classify_cdr_chunk(lines: List[str], column: int, annotate: bool) -> Tuple[Optional[str], Counter]:
+    """
+    Classify the called numbers of a chunk of CDR lines
+    :param lines: lines of a CDR CSV file (w/o header)
+    :param column: index of the column with the called number
+    :param annotate: True: return the lines with network type, NIR, carrier and state appended
+    :return: tuple (annotated lines as CSV text or None, count of calls per (network type, carrier))
+    """
+    rows = list(reader(lines))
+    numbers = np.zeros(len(rows), dtype=np.int64)
+    digits = NumberClassifier.NUMBER_DIGITS
+    for i, row in enumerate(rows):
+        number = ''.join(d for d in row[column] if d.isdigit()) if column < len(row) else ''
+        # extensions and other short numbers can't be classified
+        if len(number) >= digits:
+            numbers[i] = int(number[-digits:])
+    # for
+    codes = cdr_classifier.codes_batch(numbers)
+    values = cdr_classifier.values
+    counts = Counter(zip(codes['network_type'].tolist(), codes['carrier'].tolist()))
+    counts = Counter({(values['network_type'][t], values['carrier'][c]): n for (t, c), n in counts.items()})
+    if not annotate:
+        return None, counts
+    text = StringIO()
+    csv_writer = writer(text, lineterminator='\n')
+    columns = [[values[a][c] for c in codes[a].tolist()] for a in NumberClassifier.ATTRIBUTES]
+    for row, *classification in zip(rows, *columns):
+        csv_writer.writerow(row + classification)
+    return text.getvalue(), counts
+
+
+def csv_records(f, lines: List[str]) -> List[str]:
+    """
+    Complete a list of lines read from a CSV file to full records. A quoted field can contain line breaks: as long as
+    the number of quotes is odd the last record continues on the next line
+    :param f: file the lines were read from
+    :param lines: lines starting at a record boundary
+    :return: lines ending at a record boundary
+    """
+    quotes = sum(line.count('"') for line in lines)
+    while quotes % 2:
+        line = f.readline()
+        if not line:
+            break
+        lines.append(line)
+        quotes += line.count('"')
+    # while
+    return lines
+
+
+def cdr_chunks(file_name) -> Generator[List[str], None, None]:
+    """
+    Read a CDR file in chunks of lines of about CDR_CHUNK_BYTES. Chunks only end at record boundaries. The 1st chunk
+    only has the header
+    :param file_name: CSV file, optionally gzip compressed (.gz)
+    :return:
+    """
+    opener = gzip.open if file_name.endswith('.gz') else open
+    with opener(file_name, mode='rt', encoding='utf8', errors='replace', newline='') as f:
+        yield csv_records(f, [f.readline()])
+        while True:
+            lines = f.readlines(CDR_CHUNK_BYTES)
+            if not lines:
+                break
+            yield csv_records(f, lines)
+        # while
+    # with
+    return
+
+
+def classify_cdrs(classifier: NumberClassifier, file_names: List[str], column_name, out_file=None,
+                  jobs=1) -> Counter:
+    """
+    Classify the called numbers of CDR files. The files are streamed in chunks which are classified by a pool of
+    worker processes. At most two chunks per process are in flight so that memory use is bounded independent of the
+    size of the files
+    :param classifier:
+    :param file_names: CDR CSV files
+    :param column_name: name of the column with the called number, for example finalCalledPartyNumber
+    :param out_file: file to write the annotated CDRs to; the header of the 1st file is used. None: only count
+    :param jobs: number of worker processes. 0: one process per CPU. 1: classify in this process
+    :return: count of calls per (network type, carrier)
+    """
+    totals = Counter()
+    jobs = jobs or os.cpu_count() or 1
+    out = open(out_file, 'w', encoding='utf8', newline='') if out_file is not None else None
+    executor = ProcessPoolExecutor(max_workers=jobs, initializer=cdr_worker_init,
+                                   initargs=(classifier,)) if jobs > 1 else None
+    if executor is None:
+        cdr_worker_init(classifier)
+    pending = deque()
+
+    def collect(result):
+        annotated, counts = result
+        totals.update(counts)
+        if annotated is not None:
+            out.write(annotated)
+        progress.update(sum(counts.values()))
+
+    try:
+        with tqdm(unit='CDR', desc='classify') as progress:
+            header_written = False
+            for file_name in file_names:
+                chunks = cdr_chunks(file_name)
+                header = next(reader(next(chunks)), [])
+                try:
+                    column = [h.strip() for h in header].index(column_name)
+                except ValueError:
+                    raise ValueError(f'{file_name} has no column {column_name}')
+                if out is not None and not header_written:
+                    writer(out, lineterminator='\n').writerow(header + list(NumberClassifier.ATTRIBUTES))
+                    header_written = True
+                for lines in chunks:
+                    if executor is None:
+                        collect(classify_cdr_chunk(lines, column, out is not None))
+                        continue
+                    pending.append(executor.submit(classify_cdr_chunk, lines, column, out is not None))
+                    while len(pending) > 2 * jobs:
+                        collect(pending.popleft().result())
+                # for
+                while pending:
+                    collect(pending.popleft().result())
+            # for
+        # with
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if out is not None:
+            out.close()
+    return totals
+
+
+def cdr_classification(parsed_args):
+    """
+    Classify the called numbers of the CDR files given by --cdr and print the number of calls per network type and
+    carrier
+    :param parsed_args:
+    :return:
+    """
+    if parsed_args.fromfile is None:
+        zip_file_name = zip_from_web()
+    elif parsed_args.fromfile == '.':
+        zip_file_name = all_zips()[0]
+    else:
+        zip_file_name = parsed_args.fromfile
+    classifier = NumberClassifier.from_file(zip_file_name)
+    print(f'{len(classifier)} number ranges')
+
+    with profiler.stage('classify_cdr') as stage:
+        counts = classify_cdrs(classifier, parsed_args.cdr, parsed_args.cdrcolumn, out_file=parsed_args.cdrout,
+                               jobs=parsed_args.jobs)
+        stage['items'] = sum(counts.values())
+    if parsed_args.cdrout:
+        print(f'Classified CDRs written to {parsed_args.cdrout}')
+
+    total = sum(counts.values()) or 1
+    width = max((len(carrier) for _, carrier in counts), default=0)
+    width = max(width, len('carrier'))
+    print(f'{"type":8} {"carrier":{width}} {"calls":>10} {"share":>6}')
+    for (network_type, carrier), calls in counts.most_common():
+        print(f'{network_type or "unknown":8} {carrier:{width}} {calls:>10} {calls / total:6.1%}')
     # for
     return
 
 
-def provision_patterns(ucm, user, password, read_only, route_list_name, patterns):
-    # provision blocking translation patterns or route patterns for optimized patterns
+class ClassificationService:
+    """
+    HTTP service classifying numbers with a NumberClassifier held in memory:
+
+    * GET /classify?number=5512345678: classification of a single number
+    * POST /classify: classification of a batch of numbers given as JSON list or one number per line
+    * GET /status: ZIP file the classifier was compiled from and number of ranges
+
+    A watcher thread looks for a newer pnn_Publico ZIP (see all_zips()) and compiles a new classifier in the
+    background. The new classifier and its ZIP file name are swapped in with a single assignment; each request reads
+    the current index once, so requests in progress finish on the previous index and no request is dropped
+    """
+
+    def __init__(self, zip_file_name):
+        """
+        :param zip_file_name: ZIP file to compile the initial classifier from
+        """
+        self.index = (zip_file_name, self.compile(zip_file_name))
+        self.loaded = time.time()
+        self.stop = threading.Event()
+
+    @staticmethod
+    def compile(zip_file_name) -> NumberClassifier:
+        """
+        Classifier of a ZIP file
+        :param zip_file_name:
+        :return:
+        """
+        with profiler.stage('classifier', zip=zip_file_name) as stage:
+            classifier = NumberClassifier.from_file(zip_file_name)
+            stage['items'] = len(classifier)
+        print(f'Compiled {len(classifier)} number ranges from {zip_file_name}')
+        return classifier
+
+    def reload(self) -> bool:
+        """
+        Swap in a new classifier if a newer ZIP file than the current one exists
+        :return: True if a new classifier was swapped in
+        """
+        zip_files = all_zips()
+        current, _ = self.index
+        if not zip_files or zip_date(zip_files[0]) <= zip_date(current):
+            return False
+        try:
+            classifier = self.compile(zip_files[0])
+        except Exception as e:
+            # for example an incomplete ZIP copied by something else than download_zip(); retried on the next check
+            logging.warning(f'failed to compile {zip_files[0]}: {e}')
+            return False
+        self.index = (zip_files[0], classifier)
+        self.loaded = time.time()
+        return True
+
+    def watch(self, interval=60) -> threading.Thread:
+        """
+        Check for newer ZIP files in a background thread
+        :param interval: seconds between checks
+        :return: the watcher thread
+        """
+        def watcher():
+            while not self.stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    logging.warning(f'failed to check for new ZIP files: {e}')
+            # while
+
+        thread = threading.Thread(target=watcher, name='reload', daemon=True)
+        thread.start()
+        return thread
+
+    def status(self) -> dict:
+        """
+        Status of the service
+        :return:
+        """
+        zip_file_name, classifier = self.index
+        return dict(zip=zip_file_name, date=zip_date(zip_file_name), ranges=len(classifier),
+                    loaded=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.loaded)))
+
+    @staticmethod
+    def classify(classifier: NumberClassifier, number: str) -> dict:
+        """
+        Classification of a single number
+        :param classifier:
+        :param number:
+        :return: number and attributes (see NumberClassifier.ATTRIBUTES); '' for numbers not covered by any range
+        """
+        classification = classifier.classify(number)
+        result = dict(number=number)
+        result.update((a, getattr(classification, a) if classification else '') for a in classifier.ATTRIBUTES)
+        return result
+
+    @staticmethod
+    def classify_batch(classifier: NumberClassifier, numbers: List[str]) -> dict:
+        """
+        Classification of a batch of numbers
+        :param classifier:
+        :param numbers:
+        :return: list of numbers and per attribute the list of values in the order of the numbers; '' for numbers not
+            covered by any range
+        """
+        values = classifier.classify_batch([classifier.number(n) for n in numbers])
+        result = dict(number=numbers)
+        result.update((a, v.tolist()) for a, v in values.items())
+        return result
+
+    def handler(self) -> type:
+        """
+        Request handler class for the HTTP server
+        :return:
+        """
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive connections; responses are sent w/o waiting for delayed ACKs
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def send_json(self, status, obj):
+                body = json.dumps(obj).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path, _, query = self.path.partition('?')
+                if path == '/status':
+                    self.send_json(200, service.status())
+                    return
+                if path != '/classify':
+                    self.send_json(404, dict(error=f'not found: {path}'))
+                    return
+                numbers = parse_qs(query).get('number')
+                if not numbers:
+                    self.send_json(400, dict(error='number parameter missing'))
+                    return
+                zip_file_name, classifier = service.index
+                if len(numbers) == 1:
+                    result = service.classify(classifier, numbers[0])
+                else:
+                    result = service.classify_batch(classifier, numbers)
+                result['zip'] = zip_file_name
+                self.send_json(200, result)
+
+            def do_POST(self):
+                if self.path.partition('?')[0] != '/classify':
+                    self.send_json(404, dict(error=f'not found: {self.path}'))
+                    return
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode('utf-8')
+                if 'json' in (self.headers.get('Content-Type') or ''):
+                    try:
+                        numbers = json.loads(body)
+                    except ValueError as e:
+                        self.send_json(400, dict(error=f'invalid JSON: {e}'))
+                        return
+                    if not isinstance(numbers, list):
+                        self.send_json(400, dict(error='expected a JSON list of numbers'))
+                        return
+                    numbers = [str(n) for n in numbers]
+                else:
+                    numbers = [n.strip() for n in body.splitlines() if n.strip()]
+                zip_file_name, classifier = service.index
+                result = service.classify_batch(classifier, numbers)
+                result['zip'] = zip_file_name
+                self.send_json(200, result)
+
+            def log_message(self, format, *args):
+                logging.debug(f'classification service: {format % args}')
+
+        return Handler
+
+    def serve(self, port, address='localhost', interval=60):
+        """
+        Serve classifications on http://address:port until interrupted
+        :param port:
+        :param address:
+        :param interval: seconds between checks for newer ZIP files. 0: don't check
+        :return:
+        """
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        server = Server((address, port), self.handler())
+        if interval:
+            self.watch(interval)
+        print(f'Serving classifications on http://{address}:{server.server_address[1]}/classify')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop.set()
+            server.server_close()
+        return
+
+
+def classification_service(parsed_args):
+    """
+    Serve number classifications on the port given by --serve
+    :param parsed_args:
+    :return:
+    """
+    if parsed_args.fromfile is None:
+        zip_file_name = zip_from_web()
+    elif parsed_args.fromfile == '.':
+        zip_file_name = all_zips()[0]
+    else:
+        zip_file_name = parsed_args.fromfile
+    service = ClassificationService(zip_file_name)
+    service.serve(parsed_args.serve, address=parsed_args.serveaddress, interval=parsed_args.reloadinterval)
+    return
+
+
+class PatternState(NamedTuple):
+    """
+    Pattern with the attributes relevant for provisioning. An attribute of None is unknown or irrelevant
+    """
+    pattern: str
+    block_enable: Optional[bool] = None
+    urgency: Optional[bool] = None
+    route_list: Optional[str] = None
+    uuid: Optional[str] = None
+
+    def changes(self, existing: 'PatternState') -> dict:
+        """
+        Attributes of an existing pattern which differ from this desired pattern
+        :param existing:
+        :return: dict attribute -> (existing value, desired value)
+        """
+        changes = {}
+        for attribute in ('block_enable', 'urgency', 'route_list'):
+            desired_value, existing_value = getattr(self, attribute), getattr(existing, attribute)
+            if desired_value is not None and existing_value is not None and desired_value != existing_value:
+                changes[attribute] = (existing_value, desired_value)
+        return changes
+
+
+class PatternUpdate(NamedTuple):
+    """
+    Existing pattern which needs to be updated to match the desired pattern
+    """
+    existing: PatternState
+    desired: PatternState
+    changes: dict
+
+
+class ReconcilePlan:
+    """
+    Plan to reconcile the patterns in UCM with the desired patterns: patterns to add, update and remove
+    """
+
+    def __init__(self, desired: Iterable[PatternState], existing: Iterable[PatternState]):
+        """
+        :param desired: desired patterns
+        :param existing: patterns existing in UCM
+        """
+        desired = OrderedDict((p.pattern, p) for p in desired)
+        existing = OrderedDict((p.pattern, p) for p in existing)
+        self.add: List[PatternState] = []
+        self.update: List[PatternUpdate] = []
+        self.remove: List[PatternState] = [p for pattern, p in existing.items() if pattern not in desired]
+        self.unchanged = 0
+        for pattern, desired_pattern in desired.items():
+            existing_pattern = existing.get(pattern)
+            if existing_pattern is None:
+                self.add.append(desired_pattern)
+                continue
+            changes = desired_pattern.changes(existing_pattern)
+            if changes:
+                self.update.append(PatternUpdate(existing=existing_pattern, desired=desired_pattern,
+                                                 changes=changes))
+            else:
+                self.unchanged += 1
+        # for
+
+    def __str__(self):
+        return f'{len(self.add)} new patterns need to be provisioned\n' \
+               f'{len(self.update)} patterns need to be updated\n' \
+               f'{len(self.remove)} patterns need to be removed\n' \
+               f'{self.unchanged} patterns are unchanged'
+
+    def lines(self) -> Generator[str, None, None]:
+        """
+        Human readable plan; one line per action
+        :return:
+        """
+        for p in self.add:
+            yield f'   add {p.pattern}'
+        for u in self.update:
+            changes = ', '.join(f'{a}: {old} -> {new}' for a, (old, new) in u.changes.items())
+            yield f'update {u.existing.pattern} ({changes})'
+        for p in self.remove:
+            yield f'remove {p.pattern}'
+        return
+
+    def as_dict(self) -> dict:
+        """
+        Plan as dict for JSON export
+        :return:
+        """
+        return {'add': [p._asdict() for p in self.add],
+                'update': [{'pattern': u.existing.pattern, 'uuid': u.existing.uuid,
+                            'changes': {a: {'existing': old, 'desired': new} for a, (old, new) in u.changes.items()}}
+                           for u in self.update],
+                'remove': [p._asdict() for p in self.remove],
+                'unchanged': self.unchanged}
+
+    def export(self, file_name):
+        """
+        Write plan to a JSON file or to the console
+        :param file_name: '-' to print the plan to the console
+        :return:
+        """
+        if file_name == '-':
+            print('\n'.join(self.lines()))
+            return
+        with open(file_name, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+        tqdm.write(f'Plan written to {file_name}')
+        return
+
+
+class AXLWorkerPool:
+    """
+    Execute AXL requests concurrently with a bounded number of requests in flight. If UCM throttles AXL requests then
+    the number of requests in flight is halved and the request is retried after an exponential back off. After a
+    series of successful requests the number of requests in flight is increased again
+    """
+    # outcomes of a request
+    SUCCESS = 'success'
+    THROTTLED = 'throttled'
+    ERROR = 'error'
+
+    def __init__(self, max_in_flight=1, max_retries=6, backoff=2.0):
+        """
+        :param max_in_flight: max number of concurrent AXL requests
+        :param max_retries: max number of retries of a throttled request
+        :param backoff: initial back off in seconds after a throttled request
+        """
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.limit = max_in_flight
+        self.in_flight = 0
+        self.successes = 0
+        self.throttled = 0
+        self.condition = threading.Condition()
+
+    def _acquire(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def _release(self, outcome):
+        """
+        Release a slot for a request in flight
+        :param outcome: SUCCESS, THROTTLED or ERROR. Only successful requests count towards increasing the limit;
+            errors other than throttling neither increase nor decrease the limit
+        :return:
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if outcome == self.THROTTLED:
+                self.throttled += 1
+                self.successes = 0
+                self.limit = max(1, self.limit // 2)
+            elif outcome == self.SUCCESS:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_in_flight:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
+
+    def call(self, func, item):
+        """
+        Call func(item); retry with exponential back off if AXL is throttled
+        :param func:
+        :param item:
+        :return:
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            outcome = self.ERROR
+            try:
+                result = func(item)
+                outcome = self.SUCCESS
+                return result
+            except Exception as e:
+                if ucmaxl.AXLHelper.is_throttling_error(e):
+                    outcome = self.THROTTLED
+                if outcome != self.THROTTLED or attempt == self.max_retries:
+                    raise
+            finally:
+                self._release(outcome)
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1)
+            logging.debug(f'AXL throttled, retrying {item} in {delay:.1f}s')
+            time.sleep(delay)
+            attempt += 1
+
+    def map(self, func, items: List, desc=None) -> List[Tuple[object, Exception]]:
+        """
+        Call func for each item
+        :param func: function executing one AXL request
+        :param items: list of items
+        :param desc: description for the progress bar
+        :return: list of tuples (item, exception) for all failed calls
+        """
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor, \
+                tqdm(total=len(items), desc=desc, unit='req') as progress:
+            futures = {executor.submit(self.call, func, item): item for item in items}
+            for future in as_completed(futures):
+                e = future.exception()
+                if e is not None:
+                    logging.error(f'{desc} {futures[future]} failed: {e}')
+                    errors.append((futures[future], e))
+                progress.set_postfix(in_flight=self.limit, throttled=self.throttled, failed=len(errors),
+                                     refresh=False)
+                progress.update()
+            # for
+        # with
+        return errors
+
+
+class ProvisioningScheduler:
+    """
+    Execute a reconcile plan with adds, updates and removes overlapping each other w/o ever leaving a number
+    uncovered: a stale pattern is only removed after all new patterns overlapping with it have been added. If adding
+    one of these patterns fails then the stale pattern is not removed
+    """
+
+    def __init__(self, pool: AXLWorkerPool, plan: ReconcilePlan):
+        self.pool = pool
+        self.plan = plan
+        # for each add: indices of removes waiting for that add
+        self.dependents: List[List[int]] = [[] for _ in plan.add]
+        # for each remove: number of adds it is waiting for
+        self.waiting_for: List[int] = [0] * len(plan.remove)
+        for remove_index, add_indices in enumerate(self.removal_dependencies(plan)):
+            self.waiting_for[remove_index] = len(add_indices)
+            for add_index in add_indices:
+                self.dependents[add_index].append(remove_index)
+        # for
+
+    @staticmethod
+    def removal_dependencies(plan: ReconcilePlan) -> List[Set[int]]:
+        """
+        Determine for each pattern to be removed the patterns to be added which overlap with it
+        :param plan:
+        :return: for each remove: set of indices of adds
+        """
+        adds = [Pattern.from_ucm(p.pattern) for p in plan.add]
+        # index of the prefixes of all new patterns
+        by_prefix = {}
+        for add_index, pattern in enumerate(adds):
+            for prefix in pattern.prefixes if pattern is not None else []:
+                by_prefix.setdefault(prefix, []).append(add_index)
+        # for
+        sorted_prefixes = sorted(by_prefix)
+        unknown = {i for i, p in enumerate(adds) if p is None}
+        all_adds = set(range(len(adds)))
+
+        dependencies = []
+        for remove in plan.remove:
+            pattern = Pattern.from_ucm(remove.pattern)
+            if pattern is None:
+                # can't tell what this pattern covers: remove it after all adds
+                dependencies.append(all_adds)
+                continue
+            add_indices = set(unknown)
+            for prefix in pattern.prefixes:
+                # new patterns covering the prefix ...
+                for i in range(len(prefix) + 1):
+                    add_indices.update(by_prefix.get(prefix[:i], []))
+                # .. and new patterns within the prefix
+                for j in range(bisect_left(sorted_prefixes, prefix), len(sorted_prefixes)):
+                    other = sorted_prefixes[j]
+                    if not other.startswith(prefix):
+                        break
+                    add_indices.update(by_prefix[other])
+                # for
+            # for
+            dependencies.append(add_indices)
+        # for
+        return dependencies
+
+    def run(self, adder, updater, remover, desc='provision') -> Tuple[List, List, List, List]:
+        """
+        Execute the plan
+        :param adder: function to add a pattern; called with PatternState
+        :param updater: function to update a pattern; called with PatternUpdate
+        :param remover: function to remove a pattern; called with PatternState
+        :param desc: description for the progress bar
+        :return: tuple of lists (failed adds, failed updates, failed removes, skipped removes)
+        """
+        plan = self.plan
+        waiting_for = list(self.waiting_for)
+        ready_removes = deque(i for i, w in enumerate(waiting_for) if not w)
+        adds = deque(range(len(plan.add)))
+        updates = deque(plan.update)
+        failed_adds, failed_updates, failed_removes = [], [], []
+        pending = {}
+        total = len(plan.add) + len(plan.update) + len(plan.remove)
+        with ThreadPoolExecutor(max_workers=self.pool.max_in_flight) as executor, \
+                tqdm(total=total, desc=desc, unit='req') as progress:
+            while True:
+                # removes which became possible go first to keep the window with overlapping patterns short
+                while len(pending) < self.pool.max_in_flight and (ready_removes or adds or updates):
+                    if ready_removes:
+                        i = ready_removes.popleft()
+                        future = executor.submit(self.pool.call, remover, plan.remove[i])
+                        pending[future] = ('remove', i)
+                    elif adds:
+                        i = adds.popleft()
+                        future = executor.submit(self.pool.call, adder, plan.add[i])
+                        pending[future] = ('add', i)
+                    else:
+                        update = updates.popleft()
+                        future = executor.submit(self.pool.call, updater, update)
+                        pending[future] = ('update', update)
+                # while
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    action, item = pending.pop(future)
+                    e = future.exception()
+                    if action == 'add':
+                        if e is not None:
+                            logging.error(f'add {plan.add[item].pattern} failed: {e}')
+                            failed_adds.append((plan.add[item], e))
+                            continue
+                        for remove_index in self.dependents[item]:
+                            waiting_for[remove_index] -= 1
+                            if not waiting_for[remove_index]:
+                                ready_removes.append(remove_index)
+                        # for
+                    elif e is not None:
+                        logging.error(f'{action} {item} failed: {e}')
+                        if action == 'update':
+                            failed_updates.append((item, e))
+                        else:
+                            failed_removes.append((plan.remove[item], e))
+                    # if
+                # for
+                progress.set_postfix(in_flight=self.pool.limit, throttled=self.pool.throttled,
+                                     failed=len(failed_adds) + len(failed_updates) + len(failed_removes),
+                                     refresh=False)
+                progress.update(len(done))
+            # while
+        # with
+        skipped_removes = [plan.remove[i] for i, w in enumerate(waiting_for) if w]
+        return failed_adds, failed_updates, failed_removes, skipped_removes
+
+
+class Cluster(NamedTuple):
+    """
+    UCM cluster to provision patterns on. Attributes of None default to the values given on the command line
+    """
+    ucm: str
+    user: Optional[str] = None
+    password: Optional[str] = None
+    route_list: Optional[str] = None
+
+
+class ClusterResult(NamedTuple):
+    """
+    Outcome of provisioning patterns on one UCM cluster
+    """
+    ucm: str
+    seconds: float
+    plan: Optional[ReconcilePlan] = None
+    failed: int = 0
+    skipped: int = 0
+    error: Optional[Exception] = None
+
+
+def read_clusters(file_name) -> List[Cluster]:
+    """
+    Read an inventory of UCM clusters. One cluster per line: ucm[,user[,password[,route list]]]. Empty fields default
+    to the values given on the command line. Empty lines and lines starting with # are ignored
+    :param file_name:
+    :return: list of clusters
+    """
+    clusters = []
+    with open(file_name, newline='') as f:
+        for row in reader(f):
+            row = [c.strip() for c in row]
+            if not row or not row[0] or row[0].startswith('#'):
+                continue
+            clusters.append(Cluster(*(c or None for c in row[:4])))
+        # for
+    # with
+    return clusters
+
+
+def cluster_plan_file(plan_file, ucm):
+    """
+    Name of the file to write the plan of one of several clusters to: the UCM host is appended to the file name
+    :param plan_file: plan file name given by --plan
+    :param ucm:
+    :return:
+    """
+    if plan_file is None or plan_file == '-':
+        return plan_file
+    root, ext = os.path.splitext(plan_file)
+    host = re.sub(r'[^\w.-]', '_', ucm)
+    return f'{root}_{host}{ext}'
+
+
+def provision_cluster(ucm, user, password, read_only, route_list_name, patterns, max_in_flight=1, bulk=False,
+                      plan_file=None, label=None) -> Tuple[ReconcilePlan, int, int]:
+    """
+    Provision blocking translation patterns or route patterns for optimized patterns on one UCM cluster
+    :param label: prefix for console output and progress bars; used if several clusters are provisioned in parallel
+    :return: tuple (plan, number of failed requests, number of skipped removes)
+    """
+    prefix = f'{label} ' if label else ''
+
+    def echo(*args):
+        # tqdm.write() doesn't interleave with output of other clusters or progress bars
+        tqdm.write('\n'.join(prefix + line for line in ' '.join(str(a) for a in args).splitlines()))
 
     # AXL helper object
+    # patterns are added and removed w/o zeep. Only pattern and uuid of listed patterns are used: list w/o zeep
     axl = ucmaxl.AXLHelper(ucm, auth=(user, password), version='10.0', verify=False,
-                           timeout=60)
+                           timeout=60, pool_maxsize=max_in_flight, lean=True, lean_list=True)
+    if profiler.enabled:
+        axl.add_observer(profiler.axl_call)
 
     # assert existence of partition
-    local_partition = assert_partition(axl, PARTITION_NAME, read_only=read_only)
+    local_partition = assert_partition(axl, PARTITION_NAME, read_only=read_only, echo=echo)
 
     if route_list_name is None:
         # provision blocking translation patterns
@@ -416,15 +2648,17 @@ def provision_patterns(ucm, user, password, read_only, route_list_name, patterns
         adder = functools.partial(axl.add_translation, partition=PARTITION_NAME,
                                   description=PARTITION_NAME,
                                   block_enable=True, urgency=True)
+        updater = functools.partial(axl.update_translation, blockEnable=True, patternUrgency=True)
         remover = functools.partial(axl.remove_translation)
+        usage = ucmaxl.AXLHelper.PATTERN_USAGE_TRANSLATION
+        desired = [PatternState(pattern=p.for_ucm, block_enable=True, urgency=True) for p in patterns]
     else:
         # provision route patterns pointing to given route list
 
         # assert existence of route list
         route_list = axl.get_route_list(name=route_list_name)
         if route_list is None and not read_only:
-            print(f'route list "{route_list_name}" needs to be created before executing the script')
-            exit(2)
+            raise ValueError(f'route list "{route_list_name}" needs to be created before executing the script')
         # set methods for route patterns
         lister = functools.partial(axl.list_route_pattern, returned_tags=['pattern'])
 
@@ -436,39 +2670,181 @@ def provision_patterns(ucm, user, password, read_only, route_list_name, patterns
                                   destination={'routeListName': route_list_name},
                                   networkLocation='OffNet',
                                   description='Mobile number')
+        updater = functools.partial(axl.update_route_pattern,
+                                    patternUrgency=True,
+                                    blockEnable=False,
+                                    destination={'routeListName': route_list_name})
         remover = functools.partial(axl.remove_route_pattern)
+        usage = ucmaxl.AXLHelper.PATTERN_USAGE_ROUTE
+        desired = [PatternState(pattern=p.for_ucm, block_enable=False, urgency=True, route_list=route_list_name)
+                   for p in patterns]
 
     # get all patterns in given
-    if local_partition is None:
-        ucm_objects = []
+    with profiler.stage('axl_list', cluster=ucm) as stage:
+        if local_partition is None:
+            existing = []
+        else:
+            try:
+                # paged SQL queries are much faster than the thick AXL list request
+                existing = [PatternState(pattern=p.dnorpattern, block_enable=p.block_enable, urgency=p.urgency,
+                                         route_list=p.route_list, uuid=f'{{{p.pkid.upper()}}}')
+                            for p in axl.sql_list_pattern(partition=PARTITION_NAME, usage=usage)]
+            except zeep.exceptions.Fault as e:
+                echo(f'Failed to read patterns via SQL ({e}), falling back to thick AXL')
+                existing = [PatternState(pattern=o['pattern'], uuid=o['uuid'])
+                            for o in lister(routePartitionName=PARTITION_NAME)]
+        stage['items'] = len(existing)
+
+    echo(f'{len(existing)} patterns exist in UCM')
+
+    # determine patterns to be added/updated/removed
+    with profiler.stage('plan', cluster=ucm):
+        plan = ReconcilePlan(desired=desired, existing=existing)
+    echo(plan)
+    if plan_file is not None:
+        plan.export(plan_file)
+
+    for action, planned in (('add', plan.add), ('update', plan.update), ('remove', plan.remove)):
+        profiler.set_value('patterns_planned', len(planned), cluster=ucm, action=action)
+    profiler.set_value('patterns', plan.unchanged, cluster=ucm, action='unchanged')
+
+    if read_only:
+        return plan, 0, 0
+
+    pool = AXLWorkerPool(max_in_flight=max_in_flight)
+
+    if bulk:
+        # add new patterns
+        echo('adding patterns...')
+        with profiler.stage('add', cluster=ucm) as stage:
+            failed_adds = pool.map(lambda p: adder(pattern=p.pattern), plan.add, desc=f'{prefix}add')
+            stage['items'] = len(plan.add)
+
+        # update patterns with wrong attributes
+        echo('updating patterns...')
+        with profiler.stage('update', cluster=ucm) as stage:
+            failed_updates = pool.map(lambda u: updater(uuid=u.existing.uuid), plan.update, desc=f'{prefix}update')
+            stage['items'] = len(plan.update)
+
+        # remove patterns not needed any more; batched SQL deletes instead of one thick AXL request per pattern
+        echo('removing patterns...')
+        with profiler.stage('remove', cluster=ucm) as stage:
+            failed_removes = remove_patterns_sql(axl, pool, plan.remove, desc=f'{prefix}remove')
+            stage['items'] = len(plan.remove)
+        skipped_removes = []
     else:
-        ucm_objects = lister(routePartitionName=PARTITION_NAME)
-
-    print(f'{len(ucm_objects)} patterns exist in UCM')
-
-    # determine patterns to be added/removed
-    patterns = [p.for_ucm for p in patterns]
-    ucm_patterns = [p['pattern'] for p in ucm_objects]
-
-    new_patterns = [p for p in patterns if p not in ucm_patterns]
-    print('{} new patterns need to be provisioned'.format(len(new_patterns)))
+        # adds, updates and removes overlap; stale patterns are removed as soon as they are covered by new patterns
+        echo('provisioning patterns...')
+        scheduler = ProvisioningScheduler(pool, plan)
+        with profiler.stage('provision', cluster=ucm) as stage:
+            failed_adds, failed_updates, failed_removes, skipped_removes = scheduler.run(
+                adder=lambda p: adder(pattern=p.pattern),
+                updater=lambda u: updater(uuid=u.existing.uuid),
+                remover=lambda p: remover(uuid=p.uuid),
+                desc=f'{prefix}provision')
+            stage['items'] = len(plan.add) + len(plan.update) + len(plan.remove)
+
+    for action, planned, failed in (('add', plan.add, failed_adds), ('update', plan.update, failed_updates),
+                                    ('remove', plan.remove, failed_removes + skipped_removes)):
+        profiler.set_value('patterns', len(planned) - len(failed), cluster=ucm, action=action)
+        profiler.set_value('patterns_failed', len(failed), cluster=ucm, action=action)
+    # for
 
-    remove_objects = [o for o in ucm_objects if o['pattern'] not in patterns]
-    print('{} patterns need to be removed'.format(len(remove_objects)))
+    if failed_adds or failed_updates or failed_removes:
+        echo(f'{len(failed_adds)} patterns could not be added, {len(failed_updates)} patterns could not be updated, '
+             f'{len(failed_removes)} patterns could not be removed')
+    if skipped_removes:
+        echo(f'{len(skipped_removes)} patterns were not removed because overlapping new patterns could not be added')
+    return plan, len(failed_adds) + len(failed_updates) + len(failed_removes), len(skipped_removes)
 
-    # add new patterns
-    print('adding patterns...')
-    for pattern in tqdm(new_patterns):
-        # print('Adding pattern {}'.format(pattern))
-        if not read_only:
-            adder(pattern=pattern)
 
-    # remove patterns not needed any more
-    print('removing patterns...')
-    for pattern in tqdm(remove_objects):
-        # print('Removing pattern {}'.format(pattern['pattern']))
-        if not read_only:
-            remover(uuid=pattern['uuid'])
+def remove_patterns_sql(axl, pool: AXLWorkerPool, removes: List[PatternState],
+                        desc='remove') -> List[Tuple[PatternState, Exception]]:
+    """
+    Remove patterns with batched SQL deletes. The batches are executed by the worker pool: throttled batches are
+    retried and a failing batch doesn't stop the other batches. SQL only tells how many patterns a batch removed;
+    the patterns which could not be removed are determined by checking which patterns still exist
+    :param axl: AXL helper object
+    :param pool: worker pool
+    :param removes: patterns to remove
+    :param desc: description for the progress bar
+    :return: list of tuples (pattern, exception) of the patterns which could not be removed
+    """
+    if not removes:
+        return []
+    batches = [removes[i:i + SQL_BATCH_SIZE] for i in range(0, len(removes), SQL_BATCH_SIZE)]
+    failed_batches = pool.map(lambda batch: sum(axl.sql_remove_pattern([p.uuid for p in batch],
+                                                                       batch_size=len(batch))),
+                              batches, desc=desc)
+    errors = {p.uuid: e for batch, e in failed_batches for p in batch}
+    try:
+        remaining = pool.call(functools.partial(axl.sql_existing_pattern, batch_size=SQL_BATCH_SIZE),
+                              [p.uuid for p in removes])
+    except Exception as e:
+        logging.error(f'failed to check which patterns were removed: {e}')
+        # patterns of failed batches are considered not removed
+        return [(p, e) for batch, e in failed_batches for p in batch]
+    return [(p, errors.get(p.uuid) or ValueError('pattern still exists after SQL delete')) for p in removes
+            if p.uuid.strip('{}').lower() in remaining]
+
+
+def provision_patterns(clusters: Union[str, List[Cluster]], user, password, read_only, route_list_name, patterns,
+                       max_in_flight=1, bulk=False, plan_file=None) -> List[ClusterResult]:
+    """
+    Provision blocking translation patterns or route patterns for optimized patterns on one or more UCM clusters.
+    The patterns are only optimized once; all clusters are reconciled in parallel. A failure on one cluster doesn't
+    affect the other clusters
+    :param clusters: UCM host or list of clusters
+    :param user: AXL user for clusters w/o user
+    :param password: password for clusters w/o password
+    :param route_list_name: route list for clusters w/o route list
+    :param max_in_flight: max number of concurrent AXL requests per cluster
+    :return: list of results; one per cluster
+    """
+    if isinstance(clusters, str):
+        clusters = [Cluster(clusters)]
+    multiple = len(clusters) > 1
+
+    def provision(cluster: Cluster) -> ClusterResult:
+        start = time.perf_counter()
+        label = f'[{cluster.ucm}]' if multiple else None
+        try:
+            plan, failed, skipped = provision_cluster(
+                ucm=cluster.ucm, user=cluster.user or user, password=cluster.password or password,
+                read_only=read_only, route_list_name=cluster.route_list or route_list_name, patterns=patterns,
+                max_in_flight=max_in_flight, bulk=bulk,
+                plan_file=cluster_plan_file(plan_file, cluster.ucm) if multiple else plan_file, label=label)
+        except Exception as e:
+            logging.debug(f'provisioning {cluster.ucm} failed', exc_info=True)
+            tqdm.write(f'{label or cluster.ucm} failed: {e}')
+            return ClusterResult(ucm=cluster.ucm, seconds=time.perf_counter() - start, error=e)
+        return ClusterResult(ucm=cluster.ucm, seconds=time.perf_counter() - start, plan=plan, failed=failed,
+                             skipped=skipped)
+
+    with ThreadPoolExecutor(max_workers=len(clusters)) as executor:
+        results = list(executor.map(provision, clusters))
+
+    if multiple:
+        print_cluster_summary(results)
+    return results
+
+
+def print_cluster_summary(results: List[ClusterResult]):
+    """
+    Print one line per cluster with the size of the plan, number of failed requests and time taken
+    :param results:
+    :return:
+    """
+    width = max(len(r.ucm) for r in results)
+    print(f'{"cluster":{width}} {"add":>6} {"update":>6} {"remove":>6} {"failed":>6} {"skipped":>7} {"time":>8}')
+    for r in results:
+        if r.error is not None:
+            print(f'{r.ucm:{width}} {"":>6} {"":>6} {"":>6} {"":>6} {"":>7} {r.seconds:7.1f}s  error: {r.error}')
+            continue
+        print(f'{r.ucm:{width}} {len(r.plan.add):>6} {len(r.plan.update):>6} {len(r.plan.remove):>6} '
+              f'{r.failed:>6} {r.skipped:>7} {r.seconds:7.1f}s')
+    # for
+    return
 
 
 def main():
@@ -488,7 +2864,11 @@ def main():
     """)
 
     args.add_argument('--ucm', required=False,
-                      help='IP or FQDN of UCM publisher host. If ucm is not given then only the patterns are printed')
+                      help='IP or FQDN of UCM publisher host. Comma separated list to provision several clusters in '
+                           'parallel. If ucm is not given then only the patterns are printed')
+    args.add_argument('--clusters', required=False,
+                      help='inventory file of UCM clusters to provision in parallel. One cluster per line: '
+                           'ucm[,user[,password[,route list]]]. Empty fields default to --user, --pwd and --routelist')
     args.add_argument('--user', required=False, help='AXL user with write access to UCM')
     args.add_argument('--pwd', required=False, help='Password for AXL user with write access to UCM')
     args.add_argument('--fromfile', required=False,
@@ -497,12 +2877,61 @@ def main():
     args.add_argument('--readonly', required=False, action='store_true',
                       help='Don\'t write to UCM. Existing patterns are read if possible.')
     args.add_argument('--routelist', required=False, help='provision route patterns pointing to given route list')
+    args.add_argument('--parallel', required=False, type=int, default=1,
+                      help='max number of concurrent AXL requests. Reduced automatically while UCM throttles AXL '
+                           'requests')
+    args.add_argument('--plan', required=False,
+                      help='write the plan of patterns to add, update and remove as JSON to given file. "-": print the '
+                           'plan to the console. Use with --readonly for a dry run')
+    args.add_argument('--bulk', required=False, action='store_true',
+                      help='remove patterns with batched SQL deletes')
     args.add_argument('--analysis', required=False, action='store_true',
                       help='If present, then compare patterns of existing data sets')
+    args.add_argument('--jobs', required=False, type=int, default=1,
+                      help='number of processes to read and optimize data sets for --analysis or to classify CDRs '
+                           '(--cdr) in parallel. 0: one process per CPU')
+    args.add_argument('--diff', required=False, nargs=2, metavar=('OLD', 'NEW'),
+                      help='compare patterns of two data sets given by ZIP file name or date (dd_mm_yyyy)')
+    args.add_argument('--cdr', required=False, nargs='+', metavar='CDR',
+                      help='classify the called numbers of given CDR CSV files (optionally .gz) and print the number of '
+                           'calls per network type and carrier. The files are classified in chunks by --jobs '
+                           'processes')
+    args.add_argument('--cdrcolumn', required=False, default='finalCalledPartyNumber',
+                      help='column of the CDR files with the called number; default: finalCalledPartyNumber')
+    args.add_argument('--cdrout', required=False, metavar='FILE',
+                      help='write the CDRs with network type, NIR, carrier and state appended to given CSV file')
+    args.add_argument('--serve', required=False, type=int, metavar='PORT',
+                      help='serve classifications of numbers by network type, NIR, carrier and state on '
+                           'http://localhost:PORT/classify. Newer pnn_Publico_??_??_????.zip files in the current '
+                           'directory are picked up w/o restart')
+    args.add_argument('--serveaddress', required=False, default='localhost', metavar='ADDRESS',
+                      help='address to bind the classification service to; default: localhost')
+    args.add_argument('--reloadinterval', required=False, type=int, default=60, metavar='SECONDS',
+                      help='seconds between checks for newer ZIP files while serving classifications. 0: don\'t '
+                           'check; default: 60')
     args.add_argument('--debug', required=False, action='store_true',
                       help='enable detailed debug messages to console')
     args.add_argument('--patterns', required=False, action='store_true',
                       help='dump resulting patterns to console')
+    args.add_argument('--columnar', required=False, action='store_true',
+                      help='read number ranges into NumPy arrays instead of one dict per CSV row. Always the '
+                           'case if the cache is used')
+    args.add_argument('--nocache', required=False, action='store_true',
+                      help='don\'t read or write the cache of parsed number ranges and patterns next to each ZIP file')
+    args.add_argument('--rebuildcache', required=False, action='store_true',
+                      help='ignore existing cache files and rebuild them')
+    args.add_argument('--incremental', required=False, action='store_true',
+                      help='only summarize number ranges changed since the previous cached snapshot')
+    args.add_argument('--profile', required=False, metavar='FILE',
+                      help='write a JSON profile of the run to given file: wall time, CPU time, peak RSS and number of '
+                           'objects per stage and AXL latency histograms per operation. "-": print the profile to the '
+                           'console')
+    args.add_argument('--metricsport', required=False, type=int, metavar='PORT',
+                      help='serve Prometheus metrics of the run on http://localhost:PORT/metrics while the run is in '
+                           'progress')
+    args.add_argument('--metricsfile', required=False, metavar='FILE',
+                      help='write Prometheus metrics of the run to given file at the end of the run; for example for '
+                           'the textfile collector of the node exporter')
 
     parsed_args = args.parse_args()
 
@@ -511,32 +2940,65 @@ def main():
     else:
         logging.basicConfig(level=logging.INFO)
 
+    if parsed_args.profile or parsed_args.metricsport is not None or parsed_args.metricsfile:
+        profiler.enable()
+    # profile and metrics are also written if the run fails
+    if parsed_args.profile:
+        atexit.register(profiler.write, parsed_args.profile)
+    exporter = MetricsExporter(profiler)
+    if parsed_args.metricsport is not None:
+        exporter.serve(parsed_args.metricsport)
+    if parsed_args.metricsfile:
+        atexit.register(exporter.write, parsed_args.metricsfile)
+
     if parsed_args.analysis:
         pattern_analysis(parsed_args=parsed_args)
         return
 
+    if parsed_args.diff:
+        snapshot_diff(parsed_args=parsed_args)
+        return
+
+    if parsed_args.cdr:
+        cdr_classification(parsed_args=parsed_args)
+        return
+
+    if parsed_args.serve is not None:
+        classification_service(parsed_args=parsed_args)
+        return
+
+    ranges = None
     if parsed_args.fromfile is not None:
         # we want to read from a zip file
         if parsed_args.fromfile == '.':
             # no name was given. Take the latest one
             zip_files = all_zips()
             parsed_args.fromfile = zip_files[0]
-        patterns = patterns_from_file(parsed_args.fromfile)
+        zip_file_name = parsed_args.fromfile
     else:
-        patterns = patterns_from_web()
-    print('reading patterns...')
+        # number ranges are read while the ZIP is downloaded
+        with profiler.stage('download'):
+            zip_file_name, ranges = download_zip(parse=ranges_from_zip_stream)
 
-    patterns = optimize_patterns(patterns)
+    print('reading patterns...')
+    patterns = snapshot_patterns(zip_file_name, parsed_args, ranges=ranges)
 
     if parsed_args.patterns:
         print('\n'.join((p.for_ucm for p in patterns)))
     print(f'summarized to {len(patterns)} patterns')
 
-    if parsed_args.ucm is None:
+    clusters = [Cluster(ucm.strip()) for ucm in (parsed_args.ucm or '').split(',') if ucm.strip()]
+    if parsed_args.clusters is not None:
+        clusters.extend(read_clusters(parsed_args.clusters))
+    if not clusters:
         return
 
-    provision_patterns(ucm=parsed_args.ucm, user=parsed_args.user, password=parsed_args.pwd,
-                       read_only=parsed_args.readonly, route_list_name=parsed_args.routelist, patterns=patterns)
+    results = provision_patterns(clusters=clusters, user=parsed_args.user, password=parsed_args.pwd,
+                                 read_only=parsed_args.readonly, route_list_name=parsed_args.routelist,
+                                 patterns=patterns, max_in_flight=parsed_args.parallel, bulk=parsed_args.bulk,
+                                 plan_file=parsed_args.plan)
+    if any(r.error is not None for r in results):
+        exit(2)
     return
 
 
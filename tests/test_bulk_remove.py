@@ -0,0 +1,93 @@
+"""
+Removal of patterns with batched SQL deletes
+"""
+import uuid
+
+import zeep.exceptions
+
+import mxnumplan
+from mxnumplan import AXLWorkerPool, PatternState, remove_patterns_sql
+
+
+class FakeSQL:
+    """
+    stand-in for the SQL methods of ucmaxl.AXLHelper. A delete statement with a protected pkid fails as a whole (like
+    a foreign key violation); sticky pkids are silently not deleted
+    """
+
+    def __init__(self, pkids, protected=(), sticky=(), throttle=0, fail_check=False):
+        self.pkids = {self.key(p) for p in pkids}
+        self.protected = {self.key(p) for p in protected}
+        self.sticky = {self.key(p) for p in sticky}
+        self.throttle = throttle
+        self.fail_check = fail_check
+        self.statements = 0
+
+    @staticmethod
+    def key(pkid):
+        return pkid.strip('{}').lower()
+
+    def sql_remove_pattern(self, pkids, batch_size=200):
+        assert len(pkids) <= batch_size
+        self.statements += 1
+        if self.throttle:
+            self.throttle -= 1
+            raise zeep.exceptions.Fault('Maximum AXL Memory Allocation Consumed')
+        batch = {self.key(p) for p in pkids}
+        if batch & self.protected:
+            raise zeep.exceptions.Fault('Cannot delete: referenced by another record')
+        removed = (batch & self.pkids) - self.sticky
+        self.pkids -= removed
+        yield len(removed)
+
+    def sql_existing_pattern(self, pkids, batch_size=200):
+        if self.fail_check:
+            raise zeep.exceptions.Fault('check failed')
+        return {self.key(p) for p in pkids} & self.pkids
+
+
+def patterns(n):
+    return [PatternState(f'\\+52{i:010d}', uuid='{%s}' % str(uuid.uuid4()).upper()) for i in range(n)]
+
+
+def pool():
+    return AXLWorkerPool(max_in_flight=4, backoff=0.001)
+
+
+def test_all_removed():
+    removes = patterns(450)
+    axl = FakeSQL(p.uuid for p in removes)
+    assert remove_patterns_sql(axl, pool(), removes) == []
+    assert not axl.pkids
+    assert axl.statements == 3
+
+
+def test_failures_are_the_remaining_patterns():
+    removes = patterns(450)
+    batch_size = mxnumplan.SQL_BATCH_SIZE
+    # 2nd batch fails as a whole; a pattern of the 3rd batch is not deleted; patterns already gone are fine
+    protected = removes[batch_size + 5]
+    sticky = removes[2 * batch_size + 7]
+    gone = removes[:10]
+    axl = FakeSQL((p.uuid for p in removes[10:]), protected=[protected.uuid], sticky=[sticky.uuid], throttle=2)
+    failed = remove_patterns_sql(axl, pool(), removes)
+    failed_patterns = [p for p, _ in failed]
+    assert failed_patterns == removes[batch_size:2 * batch_size] + [sticky]
+    assert all('referenced' in str(e) for p, e in failed if p is not sticky)
+    assert 'still exists' in str(dict(failed)[sticky])
+    assert not set(failed_patterns) & set(gone)
+    # throttled batches were retried
+    assert axl.statements == 3 + 2
+
+
+def test_check_fails():
+    removes = patterns(450)
+    batch_size = mxnumplan.SQL_BATCH_SIZE
+    axl = FakeSQL((p.uuid for p in removes), protected=[removes[0].uuid], fail_check=True)
+    failed = remove_patterns_sql(axl, pool(), removes)
+    # w/o the check only the patterns of failed batches are known to be not removed
+    assert [p for p, _ in failed] == removes[:batch_size]
+
+
+def test_nothing_to_remove():
+    assert remove_patterns_sql(FakeSQL([]), pool(), []) == []
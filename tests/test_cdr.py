@@ -0,0 +1,57 @@
+"""
+Classification of CDR files
+"""
+import csv
+import gzip
+from collections import Counter
+
+import pytest
+
+import mxnumplan
+from mxnumplan import NumberClassifier
+
+
+@pytest.fixture
+def classifier():
+    return NumberClassifier.from_columns(['55', '81'], ['1234', '1234'], ['0000', '0000'], ['9999', '9999'],
+                                         dict(network_type=['MOVIL', 'FIJO'], nir=['55', '81'],
+                                              carrier=['A', 'B'], state=['CDMX', 'NL']))
+
+
+@pytest.fixture
+def cdr_file(tmp_path):
+    """
+    CDR file with line breaks in quoted fields; also in the header
+    """
+    header = ['globalCallID_callId', 'origDeviceName\nname', 'finalCalledPartyNumber', 'comment']
+    rows = [[str(i), f'SEP{i:012d}', f'{["55", "81", "33"][i % 3]}1234{i:04d}',
+             'line\nbreak "quoted"' if i % 7 == 0 else 'plain']
+            for i in range(500)]
+    file_name = str(tmp_path / 'cdr.csv.gz')
+    with gzip.open(file_name, mode='wt', encoding='utf8', newline='') as f:
+        csv.writer(f).writerows([header] + rows)
+    return file_name, header, rows
+
+
+def test_chunks_end_at_records(monkeypatch, cdr_file):
+    file_name, header, rows = cdr_file
+    monkeypatch.setattr(mxnumplan, 'CDR_CHUNK_BYTES', 100)
+    chunks = list(mxnumplan.cdr_chunks(file_name))
+    assert len(chunks) > 10
+    assert list(csv.reader(chunks[0])) == [header]
+    assert [row for chunk in chunks[1:] for row in csv.reader(chunk)] == rows
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_classify_cdrs(monkeypatch, tmp_path, classifier, cdr_file, jobs):
+    file_name, header, rows = cdr_file
+    monkeypatch.setattr(mxnumplan, 'CDR_CHUNK_BYTES', 1000)
+    out_file = str(tmp_path / 'out.csv')
+    counts = mxnumplan.classify_cdrs(classifier, [file_name], 'finalCalledPartyNumber', out_file=out_file, jobs=jobs)
+    assert counts == Counter({('MOVIL', 'A'): 167, ('FIJO', 'B'): 167, ('', ''): 166})
+    with open(out_file, encoding='utf8', newline='') as f:
+        out = list(csv.reader(f))
+    assert out[0] == header + list(NumberClassifier.ATTRIBUTES)
+    assert [row[:len(header)] for row in out[1:]] == rows
+    assert [row[len(header):] for row in out[1:4]] == [['MOVIL', '55', 'A', 'CDMX'], ['FIJO', '81', 'B', 'NL'],
+                                                       ['', '', '', '']]
@@ -0,0 +1,84 @@
+"""
+Classification of numbers by NumberClassifier
+"""
+import random
+
+import numpy as np
+import pytest
+
+from mxnumplan import NumberClassifier
+
+
+def classifier(ranges):
+    """
+    :param ranges: list of (first, last, carrier) with 10 digit numbers as strings
+    """
+    nir = [f[:2] for f, _, _ in ranges]
+    serie = [f[2:6] for f, _, _ in ranges]
+    start = [f[6:] for f, _, _ in ranges]
+    end = [l[6:] for _, l, _ in ranges]
+    carriers = [c for _, _, c in ranges]
+    return NumberClassifier.from_columns(nir, serie, start, end,
+                                         dict(network_type=['MOVIL'] * len(ranges), nir=nir, carrier=carriers,
+                                              state=['CDMX'] * len(ranges)))
+
+
+def carriers(c: NumberClassifier, numbers):
+    single = [c.classify(n) for n in numbers]
+    single = [s.carrier if s is not None else '' for s in single]
+    batch = c.classify_batch([int(n) for n in numbers])['carrier'].tolist()
+    assert single == batch
+    return single
+
+
+def test_adjacent_ranges_are_merged():
+    c = classifier([('5512340000', '5512344999', 'A'), ('5512345000', '5512349999', 'A'),
+                    ('5512350000', '5512359999', 'B')])
+    assert len(c) == 2
+    assert carriers(c, ['5512340000', '5512349999', '5512350000', '5512360000']) == ['A', 'A', 'B', '']
+
+
+def test_nested_range_after_outer_range():
+    c = classifier([('5512340000', '5512349999', 'A'), ('5512345000', '5512345999', 'B')])
+    assert carriers(c, ['5512340000', '5512344999', '5512345000', '5512345999', '5512346000', '5512349999']) == \
+        ['A', 'A', 'B', 'B', 'A', 'A']
+
+
+def test_nested_range_before_outer_range():
+    # the outer range comes last and covers the nested range
+    c = classifier([('5512345000', '5512345999', 'B'), ('5512340000', '5512349999', 'A')])
+    assert carriers(c, ['5512340000', '5512345500', '5512349999']) == ['A', 'A', 'A']
+    assert len(c) == 1
+
+
+def test_overlaps_like_brute_force():
+    rng = random.Random(7)
+    ranges = []
+    for _ in range(300):
+        start = rng.randrange(0, 9000)
+        end = min(9999, start + rng.randrange(0, 1500))
+        serie = rng.choice(['1234', '1235'])
+        ranges.append((f'55{serie}{start:04d}', f'55{serie}{end:04d}', rng.choice('ABC')))
+    # for
+    c = classifier(ranges)
+    numbers = [f'55{serie}{i:04d}' for serie in ('1233', '1234', '1235') for i in range(0, 10000, 7)]
+    expected = []
+    for n in numbers:
+        covering = [carrier for first, last, carrier in ranges if first <= n <= last]
+        expected.append(covering[-1] if covering else '')
+    # for
+    assert carriers(c, numbers) == expected
+
+
+def test_no_ranges():
+    c = classifier([])
+    assert len(c) == 0
+    assert c.classify('5512345678') is None
+    assert c.lookup([5512345678, 0]).tolist() == [-1, -1]
+    assert c.classify_batch(np.array([5512345678]))['carrier'].tolist() == ['']
+
+
+@pytest.mark.parametrize('number,expected', [('+52 55 1234 5678', 5512345678), ('005215512345678', 5512345678),
+                                             (5215512345678, 5512345678), ('', 0)])
+def test_number(number, expected):
+    assert NumberClassifier.number(number) == expected
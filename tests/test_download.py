@@ -0,0 +1,167 @@
+"""
+Download of the numbering plan ZIP from a local stand-in of the IFT web site
+"""
+import io
+import json
+import os
+import re
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import pytest
+
+import mxnumplan
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ZIP_NAME = 'pnn_Publico_21_05_2019.zip'
+PAGE = b'<html><form id="FORM_planes" action="/download"><input name="a" value="1"/>' \
+       b'<button name="b">download</button></form></html>'
+
+
+def small_zip(rows=5000):
+    """
+    ZIP with the first rows of the snapshot in the repository
+    """
+    with zipfile.ZipFile(os.path.join(REPO, 'pnn_Publico_13_05_2019.zip')) as z:
+        name = z.namelist()[0]
+        with z.open(name) as f:
+            lines = [f.readline() for _ in range(rows)]
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr(name.replace('13_05_2019', '21_05_2019'), b''.join(lines))
+    return data.getvalue()
+
+
+class IFT:
+    """
+    stand-in for the IFT web site: serves one ZIP with an ETag and supports conditional and range requests
+    """
+
+    def __init__(self, data, etag='"v1"'):
+        self.data = data
+        self.etag = etag
+        # truncate the next response after given number of bytes (w/o Content-Length)
+        self.truncate = None
+        # False: responses w/o Content-Length
+        self.content_length = True
+        # start of the content range of 206 responses; None: start requested by the client
+        self.range_start = None
+        # headers of all POST requests
+        self.requests = []
+        ift = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(PAGE)))
+                self.end_headers()
+                self.wfile.write(PAGE)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                ift.requests.append(dict(self.headers))
+                self.close_connection = True
+                if self.headers.get('If-None-Match') == ift.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                data = ift.data
+                m = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+                if m and self.headers.get('If-Range') == ift.etag:
+                    start = int(m.group(1)) if ift.range_start is None else ift.range_start
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+                    data = data[start:]
+                else:
+                    self.send_response(200)
+                    self.send_header('Content-Disposition', f'attachment; filename="{ZIP_NAME}"')
+                self.send_header('ETag', ift.etag)
+                if ift.truncate is not None:
+                    data = data[:ift.truncate]
+                    ift.truncate = None
+                elif ift.content_length:
+                    self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        class Server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(('localhost', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://localhost:{self.server.server_address[1]}/page'
+
+
+@pytest.fixture
+def ift(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    site = IFT(small_zip())
+    yield site
+    site.server.shutdown()
+    site.server.server_close()
+
+
+def state():
+    with open(mxnumplan.DOWNLOAD_STATE_FILE) as f:
+        return json.load(f)
+
+
+def downloaded(ift):
+    with open(ZIP_NAME, 'rb') as f:
+        return f.read() == ift.data
+
+
+def test_download_and_not_modified(ift):
+    file_name, ranges = mxnumplan.download_zip(ift.url, parse=mxnumplan.ranges_from_zip_stream)
+    assert file_name == ZIP_NAME and downloaded(ift)
+    assert len(ranges) == 4999
+    assert state() == dict(file_name=ZIP_NAME, etag='"v1"', last_modified=None, complete=True)
+
+    assert mxnumplan.download_zip(ift.url) == (ZIP_NAME, None)
+    assert ift.requests[-1]['If-None-Match'] == '"v1"'
+    assert not os.path.exists(f'{ZIP_NAME}.part')
+
+
+def test_changed_snapshot_is_downloaded(ift):
+    mxnumplan.download_zip(ift.url)
+    # same file name, different content; w/o Content-Length the size can't tell
+    ift.data = small_zip(rows=4000)
+    ift.etag = '"v2"'
+    ift.content_length = False
+    assert mxnumplan.download_zip(ift.url) == (ZIP_NAME, None)
+    assert downloaded(ift)
+    assert state()['etag'] == '"v2"'
+
+
+def test_truncated_download_is_not_installed(ift):
+    ift.truncate = len(ift.data) // 2
+    with pytest.raises(IOError):
+        mxnumplan.download_zip(ift.url, parse=mxnumplan.ranges_from_zip_stream)
+    assert not os.path.exists(ZIP_NAME)
+    assert os.path.getsize(f'{ZIP_NAME}.part') == len(ift.data) // 2
+    assert not state()['complete']
+
+    # next run resumes the download instead of getting a 304 for the broken ZIP
+    assert mxnumplan.download_zip(ift.url) == (ZIP_NAME, None)
+    assert 'If-None-Match' not in ift.requests[-1]
+    assert ift.requests[-1]['Range'] == f'bytes={len(ift.data) // 2}-'
+    assert downloaded(ift) and state()['complete']
+    assert not os.path.exists(f'{ZIP_NAME}.part')
+
+
+def test_range_mismatch_restarts_download(ift):
+    ift.truncate = len(ift.data) // 2
+    with pytest.raises(IOError):
+        mxnumplan.download_zip(ift.url)
+    # the web site answers the range request with a different range
+    ift.range_start = 100
+    assert mxnumplan.download_zip(ift.url) == (ZIP_NAME, None)
+    assert 'Range' in ift.requests[-2]
+    assert 'Range' not in ift.requests[-1] and 'If-Range' not in ift.requests[-1]
+    assert downloaded(ift) and state()['complete']
+    assert not os.path.exists(f'{ZIP_NAME}.part')
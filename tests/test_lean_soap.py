@@ -0,0 +1,185 @@
+"""
+Lean SOAP fast path of ucmaxl.AXLHelper against zeep
+"""
+import io
+
+import pytest
+import requests
+import urllib3
+import zeep.exceptions
+from lxml import etree
+
+import ucmaxl
+
+NS = 'http://www.cisco.com/AXL/API/10.0'
+SOAP_ENV = 'http://schemas.xmlsoap.org/soap/envelope/'
+UUID = '{1E8B8F3C-3D64-1C6B-A2C0-0D1A83CA5B6B}'
+
+
+def envelope(body):
+    return ('<?xml version="1.0" encoding="UTF-8"?><soapenv:Envelope xmlns:soapenv="{}"><soapenv:Body>{}'
+            '</soapenv:Body></soapenv:Envelope>'.format(SOAP_ENV, body)).encode('utf-8')
+
+
+def response(operation, content):
+    return envelope('<ns:{op}Response xmlns:ns="{ns}">{content}</ns:{op}Response>'.format(op=operation, ns=NS,
+                                                                                          content=content))
+
+
+class FakeUCM(requests.adapters.BaseAdapter):
+    """
+    Transport adapter answering AXL requests with canned responses; records the operations of all requests
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.operations = []
+        # operation -> (status, content)
+        self.responses = {}
+
+    def send(self, request, **kwargs):
+        body = etree.fromstring(request.body).find('{{{}}}Body'.format(SOAP_ENV))[0]
+        operation = etree.QName(body).localname
+        self.operations.append(operation)
+        status, content = self.responses[operation]
+        r = requests.Response()
+        r.status_code = status
+        r.raw = urllib3.HTTPResponse(body=io.BytesIO(content), status=status, preload_content=False)
+        r.headers = requests.structures.CaseInsensitiveDict({'Content-Type': 'text/xml; charset=utf-8'})
+        r.url = request.url
+        r.request = request
+        r.encoding = 'utf-8'
+        return r
+
+    def close(self):
+        pass
+
+
+def helper(ucm, **kwargs):
+    axl = ucmaxl.AXLHelper('ucm', auth=('user', 'password'), version='10.0', verify=False, **kwargs)
+    axl.session.mount('https://', ucm)
+    return axl
+
+
+@pytest.fixture
+def ucm():
+    return FakeUCM()
+
+
+def normalized(element):
+    """
+    element tree w/o namespaces; booleans in lower case like zeep renders them
+    """
+    text = element.text or ''
+    if text in ('True', 'False'):
+        text = text.lower()
+    return etree.QName(element).localname, text, sorted(element.attrib.items()), [normalized(c) for c in element]
+
+
+RENDER_CASES = [
+    ('addTransPattern',
+     dict(transPattern=ucmaxl.AXLHelper.translation_values('\\+52123XXXX', 'mobile', 'mobile & <co>',
+                                                          block_enable=True))),
+    ('addRoutePattern',
+     dict(routePattern=dict(pattern='\\+52[1-3]XX', routePartitionName='mobile', digitDiscardInstructionName='PreDot',
+                            patternUrgency=True, blockEnable=False, destination={'routeListName': 'RL'},
+                            networkLocation='OffNet', description='Mobile number'))),
+    ('removeTransPattern', dict(uuid='{ABC}')),
+    ('removeRoutePattern', dict(uuid='{ABC}')),
+    ('listTransPattern', dict(searchCriteria={'routePartitionName': 'mobile'}, returnedTags={'pattern': ''})),
+    ('listRoutePattern', dict(searchCriteria={'pattern': '%'},
+                              returnedTags={t: '' for t in ucmaxl.AXLHelper.ROUTE_PATTERN_TAGS})),
+]
+
+
+@pytest.mark.parametrize('operation,values', RENDER_CASES, ids=[c[0] for c in RENDER_CASES])
+def test_render_like_zeep(ucm, operation, values):
+    axl = helper(ucm)
+    message = axl.client.create_message(axl.service, operation, **values)
+    expected = message.find('.//{{{}}}Body'.format(SOAP_ENV))[0]
+    binding_operation = axl.service._binding._operations[operation]
+    qname = etree.QName(binding_operation.input.body.qname)
+    body = ucmaxl.AXLHelper.lean_render(binding_operation.input.body.type, values)
+    rendered = etree.fromstring('<ns0:{op} xmlns:ns0="{ns}" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+                                '{body}</ns0:{op}>'.format(op=qname.localname, ns=qname.namespace, body=body))
+    assert normalized(rendered) == normalized(expected)
+
+
+def test_add_and_remove(ucm):
+    ucm.responses['addTransPattern'] = (200, response('addTransPattern', f'<return>{UUID}</return>'))
+    ucm.responses['removeTransPattern'] = (200, response('removeTransPattern', f'<return>{UUID}</return>'))
+    for lean in (False, True):
+        axl = helper(ucm, lean=lean)
+        assert axl.add_translation('\\+521XXXX', 'mobile', 'mobile', block_enable=True)['return'] == UUID
+        assert axl.remove_translation(UUID)['return'] == UUID
+    assert ucm.operations == ['addTransPattern', 'removeTransPattern'] * 2
+
+
+def test_list_like_zeep(ucm):
+    rows = ''.join(f'<transPattern uuid="{{U{i}}}"><pattern>\\+52{i}</pattern>'
+                   f'<routePartitionName uuid="{{P}}">mobile</routePartitionName></transPattern>' for i in range(3))
+    ucm.responses['listTransPattern'] = (200, response('listTransPattern', f'<return>{rows}</return>'))
+    tags = ['pattern', 'routePartitionName']
+    expected = helper(ucm).list_translation(returned_tags=tags, routePartitionName='mobile')
+    listed = helper(ucm, lean=True, lean_list=True).list_translation(returned_tags=tags, routePartitionName='mobile')
+    assert [{k: v for k, v in row.items() if k in tags + ['uuid']} for row in expected] == listed
+
+
+def test_list_empty_return(ucm):
+    ucm.responses['listTransPattern'] = (200, response('listTransPattern', '<return/>'))
+    axl = helper(ucm, lean=True, lean_list=True)
+    assert axl.list_translation(routePartitionName='mobile') == []
+    assert ucm.operations == ['listTransPattern']
+
+
+def test_list_not_lean_by_default(ucm):
+    # w/o lean_list the rows come from zeep
+    ucm.responses['listTransPattern'] = (200, response('listTransPattern', '<return/>'))
+    assert helper(ucm, lean=True).lean_call('listTransPattern', searchCriteria={'pattern': '%'},
+                                            returnedTags={'pattern': ''}) is ucmaxl.AXLHelper.LEAN_UNAVAILABLE
+    assert ucm.operations == []
+
+
+def test_empty_return_sent_once(ucm):
+    # an empty <return/> is a result: the request must not be repeated through zeep
+    ucm.responses['addTransPattern'] = (200, response('addTransPattern', '<return/>'))
+    ucm.responses['removeRoutePattern'] = (200, response('removeRoutePattern', '<return/>'))
+    axl = helper(ucm, lean=True)
+    assert axl.add_translation('\\+521XXXX', 'mobile', 'mobile')['return'] is None
+    assert axl.remove_route_pattern(UUID)['return'] is None
+    assert ucm.operations == ['addTransPattern', 'removeRoutePattern']
+
+
+def test_unrenderable_falls_back_to_zeep(ucm):
+    ucm.responses['addRoutePattern'] = (200, response('addRoutePattern', f'<return>{UUID}</return>'))
+    axl = helper(ucm, lean=True)
+    # foreign key with attributes can't be rendered w/o zeep
+    values = dict(RENDER_CASES[1][1]['routePattern'], routePartitionName={'_value_1': 'mobile', 'uuid': '{P}'})
+    assert axl.lean_call('addRoutePattern', routePattern=values) is ucmaxl.AXLHelper.LEAN_UNAVAILABLE
+    assert ucm.operations == []
+    assert axl.add_route_pattern(**values) == UUID
+    assert ucm.operations == ['addRoutePattern']
+
+
+FAULT = envelope('<soapenv:Fault><faultcode>soapenv:Server</faultcode>'
+                 '<faultstring>Maximum AXL Memory Allocation Consumed</faultstring>'
+                 '<detail><axlError><axlcode>-1</axlcode></axlError></detail></soapenv:Fault>')
+
+
+@pytest.mark.parametrize('lean', [False, True])
+def test_fault(ucm, lean):
+    ucm.responses['addTransPattern'] = (500, FAULT)
+    with pytest.raises(zeep.exceptions.Fault) as e:
+        helper(ucm, lean=lean).add_translation('1', 'mobile', 'mobile')
+    assert e.value.message == 'Maximum AXL Memory Allocation Consumed'
+    assert ucmaxl.AXLHelper.is_throttling_error(e.value)
+    assert ucm.operations == ['addTransPattern']
+
+
+@pytest.mark.parametrize('lean', [False, True])
+def test_transport_error(ucm, lean):
+    ucm.responses['removeTransPattern'] = (503, b'')
+    with pytest.raises(zeep.exceptions.TransportError) as e:
+        helper(ucm, lean=lean).remove_translation(UUID)
+    assert e.value.status_code == 503
+    assert ucm.operations == ['removeTransPattern']
@@ -0,0 +1,181 @@
+"""
+Optimization of the mobile ranges to patterns
+"""
+import os
+import random
+
+import pytest
+
+import mxnumplan
+from mxnumplan import NumberRanges, Pattern, PatternTrie
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ZIP_NAME = os.path.join(REPO, 'pnn_Publico_13_05_2019.zip')
+
+
+def expand_and_summarize(patterns):
+    """
+    reference: expand all ranges to simple patterns and summarize them with one sorted pass per pattern length
+    """
+    patterns = list(Pattern.expand_patterns(sorted(patterns)))
+    for pattern_len in range(10, 2, -1):
+        patterns.sort()
+        patterns = list(Pattern.summarize(patterns, pattern_len))
+    # for
+    return [p.for_ucm for p in patterns]
+
+
+def trie(patterns):
+    t = PatternTrie()
+    for p in patterns:
+        t.add(p)
+    return [p.for_ucm for p in t.patterns()]
+
+
+def coverage(ucm_patterns):
+    """
+    numbers covered by patterns as sorted list of disjoint intervals (first, last)
+    """
+    intervals = []
+    for prefix in (prefix for p in ucm_patterns for prefix in Pattern.from_ucm(p).prefixes):
+        size = 10 ** (10 - len(prefix))
+        intervals.append((int(prefix) * size, (int(prefix) + 1) * size - 1))
+    # for
+    merged = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    # for
+    return merged
+
+
+def overlapping(ucm_patterns):
+    patterns = [Pattern.from_ucm(p) for p in ucm_patterns]
+    return any(a.overlaps(b) for i, a in enumerate(patterns) for b in patterns[i + 1:])
+
+
+def random_ranges(rng, n, overlapping):
+    """
+    random ranges in a few series. W/o overlapping the ranges are disjoint
+    """
+    ranges = []
+    for serie in rng.sample(range(1000, 1100), 10):
+        bounds = sorted(rng.sample(range(10000), 2 * n))
+        for start, end in zip(bounds[::2], bounds[1::2]):
+            if overlapping:
+                end = min(9999, end + rng.randrange(0, 3000))
+            ranges.append(Pattern(f'55{serie}', f'{start:04d}', f'{end:04d}'))
+        # for
+    # for
+    return ranges
+
+
+def test_snapshot_like_expand_and_summarize():
+    rows = [Pattern(p) for p in mxnumplan.patterns_from_file(ZIP_NAME) if p[' TIPO_RED'] == 'MOVIL']
+    expected = expand_and_summarize(rows)
+    assert trie(rows) == expected
+    assert [p.for_ucm for p in mxnumplan.optimize_patterns(mxnumplan.ranges_from_file(ZIP_NAME))] == expected
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_disjoint_ranges_like_expand_and_summarize(seed):
+    ranges = random_ranges(random.Random(seed), 20, overlapping=False)
+    assert trie(ranges) == expand_and_summarize(ranges)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_overlapping_ranges(seed):
+    """
+    With overlapping or duplicate ranges the outputs differ: expand + summarize can emit patterns which overlap each
+    other (a summary of a prefix next to a pattern within the prefix). The trie covers the same numbers w/o overlaps
+    """
+    ranges = random_ranges(random.Random(seed), 20, overlapping=True)
+    ranges += ranges[:5]
+    expected = expand_and_summarize(ranges)
+    patterns = trie(ranges)
+    assert coverage(patterns) == coverage(expected)
+    assert not overlapping(patterns)
+    assert len(patterns) <= len(expected)
+
+
+def test_nested_range():
+    ranges = [Pattern('551234', '0000', '9999'), Pattern('551234', '5000', '5999')]
+    assert expand_and_summarize(ranges) == ['\\+52551234XXXX', '\\+525512345XXX']
+    assert trie(ranges) == ['\\+52551234XXXX']
+
+
+def columns(ranges: NumberRanges):
+    """
+    ranges as list of (nir, serie, start, end, network type) strings
+    """
+    return [(str(nir), f'{serie:0{NumberRanges.PREFIX_DIGITS - len(str(nir))}d}', f'{start:04d}', f'{end:04d}',
+             ranges.network_types[t])
+            for nir, serie, start, end, t in zip(ranges.nir.tolist(), ranges.serie.tolist(), ranges.start.tolist(),
+                                                 ranges.end.tolist(), ranges.network_type.tolist())]
+
+
+def from_rows(rows) -> NumberRanges:
+    return NumberRanges.from_columns(*zip(*rows))
+
+
+def modified(rows, rng: random.Random):
+    """
+    next snapshot: ranges changing network type, removed, split and added
+    """
+    rows = list(rows)
+    for i in rng.sample(range(len(rows)), 20):
+        nir, serie, start, end, network_type = rows[i]
+        rows[i] = (nir, serie, start, end, 'FIJO' if network_type == 'MOVIL' else 'MOVIL')
+    for i in sorted(rng.sample(range(len(rows)), 10), reverse=True):
+        del rows[i]
+    for i in rng.sample(range(len(rows)), 10):
+        nir, serie, start, end, network_type = rows[i]
+        if int(end) > int(start):
+            split = rng.randrange(int(start), int(end))
+            rows[i] = (nir, serie, start, f'{split:04d}', network_type)
+            rows.append((nir, serie, f'{split + 1:04d}', end, 'FIJO' if network_type == 'MOVIL' else 'MOVIL'))
+    # for
+    rows.extend(('99', f'{serie:04d}', '0000', '9999', 'MOVIL') for serie in rng.sample(range(10000), 5))
+    return rows
+
+
+def synthetic_rows(rng: random.Random):
+    """
+    ranges in a few series; some series completely mobile so that patterns collapse across prefixes
+    """
+    rows = []
+    for serie in range(1200, 1300):
+        if serie < 1250:
+            rows.append(('55', str(serie), '0000', '9999', 'MOVIL'))
+            continue
+        bounds = sorted(rng.sample(range(1, 10000), 9))
+        for start, end in zip([0] + bounds, [b - 1 for b in bounds] + [9999]):
+            rows.append(('81', str(serie), f'{start:04d}', f'{end:04d}', rng.choice(['MOVIL', 'FIJO'])))
+    # for
+    return rows
+
+
+def assert_incremental(previous_rows, rows):
+    previous_ranges, ranges = from_rows(previous_rows), from_rows(rows)
+    previous_patterns = mxnumplan.optimize_patterns(previous_ranges)
+    incremental = mxnumplan.optimize_patterns_incremental(ranges, previous_ranges, previous_patterns)
+    assert [p.for_ucm for p in incremental] == [p.for_ucm for p in mxnumplan.optimize_patterns(ranges)]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_incremental_like_rebuild(seed):
+    rng = random.Random(seed)
+    previous_rows = synthetic_rows(rng)
+    assert_incremental(previous_rows, modified(previous_rows, rng))
+
+
+def test_incremental_unchanged():
+    rows = synthetic_rows(random.Random(0))
+    assert_incremental(rows, rows)
+
+
+def test_incremental_snapshot_like_rebuild():
+    rows = columns(mxnumplan.ranges_from_file(ZIP_NAME))
+    assert_incremental(rows, modified(rows, random.Random(0)))
@@ -0,0 +1,30 @@
+"""
+Pattern parsing and formatting
+"""
+import pytest
+
+from mxnumplan import Pattern
+
+
+@pytest.mark.parametrize('prefix,summary', [('55', ''), ('5512', '37'), ('551234567', '0123456789'),
+                                            ('5512345678', '')])
+def test_from_ucm_round_trip(prefix, summary):
+    pattern = Pattern(prefix, '', '', summary=summary)
+    assert Pattern.from_ucm(pattern.for_ucm) == pattern
+
+
+@pytest.mark.parametrize('ucm_pattern', [
+    # more than 10 digits
+    '\\+52551234567890',
+    '\\+5255123456789[37]',
+    '\\+5255XXXXXXXXXX',
+    # less than 10 digits
+    '\\+5255XXX',
+    '\\+5255[37]X',
+    # not created by for_ucm
+    '\\+52!',
+    '9.@',
+    '\\+1212XXXXXXX',
+])
+def test_from_ucm_unknown(ucm_pattern):
+    assert Pattern.from_ucm(ucm_pattern) is None
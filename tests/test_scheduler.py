@@ -0,0 +1,86 @@
+"""
+Ordering of adds and removes by ProvisioningScheduler
+"""
+import random
+import threading
+import time
+
+from mxnumplan import AXLWorkerPool, Pattern, PatternState, ProvisioningScheduler, ReconcilePlan
+
+
+def plan_of(desired, existing):
+    return ReconcilePlan([PatternState(p) for p in desired], [PatternState(p, uuid=p) for p in existing])
+
+
+def ucm(prefix, summary=''):
+    return Pattern(prefix, '', '', summary=summary).for_ucm
+
+
+def test_removal_dependencies():
+    adds = [ucm('5'), ucm('551'), ucm('56'), ucm('5512', '37'), ucm('8')]
+    removes = [ucm('55'), ucm('5513'), ucm('9'), '\\+52551234567890', '9.@']
+    plan = plan_of(adds, removes)
+    assert [p.pattern for p in plan.add] == adds
+    assert [p.pattern for p in plan.remove] == removes
+    dependencies = ProvisioningScheduler.removal_dependencies(plan)
+    all_adds = set(range(len(adds)))
+    assert dependencies == [
+        # 55: covered by 5, contains 551 and 5512[37]
+        {0, 1, 3},
+        # 5513: covered by 5 and 551
+        {0, 1},
+        # 9: no overlap
+        set(),
+        # patterns which can't be parsed are removed after all adds
+        all_adds,
+        all_adds,
+    ]
+
+
+def random_patterns(rng, n):
+    patterns = set()
+    while len(patterns) < n:
+        prefix = ''.join(rng.choice('0123456789') for _ in range(rng.randint(2, 5)))
+        if rng.random() < 0.3:
+            patterns.add(ucm(prefix, ''.join(sorted(rng.sample('0123456789', 3)))))
+        else:
+            patterns.add(ucm(prefix))
+    # while
+    return patterns
+
+
+def test_removes_wait_for_overlapping_adds():
+    rng = random.Random(1)
+    plan = plan_of(random_patterns(rng, 300), random_patterns(rng, 300))
+    failing = {p.pattern for p in rng.sample(plan.add, 20)}
+    added, removed = set(), []
+    lock = threading.Lock()
+
+    def adder(p: PatternState):
+        time.sleep(rng.random() / 2000)
+        if p.pattern in failing:
+            raise RuntimeError('add failed')
+        with lock:
+            added.add(p.pattern)
+
+    def remover(p: PatternState):
+        # all new patterns overlapping with the removed pattern have to exist already
+        stale = Pattern.from_ucm(p.pattern)
+        with lock:
+            missing = [a.pattern for a in plan.add if stale.overlaps(Pattern.from_ucm(a.pattern)) and
+                       a.pattern not in added]
+            removed.append((p.pattern, missing))
+
+    scheduler = ProvisioningScheduler(AXLWorkerPool(max_in_flight=8), plan)
+    failed_adds, failed_updates, failed_removes, skipped_removes = scheduler.run(adder, None, remover)
+    assert {p.pattern for p, _ in failed_adds} == failing
+    assert not failed_updates and not failed_removes
+    assert all(not missing for _, missing in removed)
+    # each remove is either executed or skipped because an overlapping add failed
+    assert skipped_removes and removed
+    skipped = {p.pattern for p in skipped_removes}
+    assert skipped.isdisjoint(p for p, _ in removed)
+    assert len(skipped) + len(removed) == len(plan.remove)
+    for p in skipped_removes:
+        stale = Pattern.from_ucm(p.pattern)
+        assert any(stale.overlaps(Pattern.from_ucm(f)) for f in failing)
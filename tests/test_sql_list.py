@@ -0,0 +1,60 @@
+"""
+Listing patterns with paged SQL queries
+"""
+import re
+import sqlite3
+
+import pytest
+
+from ucmaxl import AXLHelper, SQLPattern
+
+
+class SQLiteAXL(AXLHelper):
+    """
+    AXLHelper executing the SQL queries against a minimal SQLite copy of the UCM tables
+    """
+
+    def __init__(self, numplan, devices, mappings):
+        self.db = sqlite3.connect(':memory:')
+        self.db.executescript('''
+            create table routepartition (pkid text, name text);
+            create table numplan (pkid text, dnorpattern text, fkroutepartition text, blockenable text,
+                                  patternurgency text, tkpatternusage integer);
+            create table device (pkid text, name text);
+            create table devicenumplanmap (fknumplan text, fkdevice text);
+            insert into routepartition values ('p1', 'mobile'), ('p2', 'other');
+        ''')
+        self.db.executemany('insert into numplan values (?, ?, ?, ?, ?, ?)', numplan)
+        self.db.executemany('insert into device values (?, ?)', devices)
+        self.db.executemany('insert into devicenumplanmap values (?, ?)', mappings)
+        self.queries = 0
+
+    def sql_query_rows(self, query):
+        self.queries += 1
+        # Informix: select first n ...; SQLite: select ... limit n
+        query = re.sub(r'^select first (\d+) (.*)$', r'select \2 limit \1', query)
+        return self.db.execute(query).fetchall()
+
+
+@pytest.fixture
+def axl():
+    numplan = [(f'pk{i:03d}', f'\\+52{i:010d}', 'p1' if i % 5 else 'p2', 't' if i % 2 else 'f', 'f', 3)
+               for i in range(100)]
+    devices = [('rl1', 'RL-A'), ('rl2', 'RL-B'), ('sep', 'SEP001122334455')]
+    # every 3rd pattern is mapped to several devices
+    mappings = [(f'pk{i:03d}', 'rl1') for i in range(0, 100, 2)] + \
+               [(f'pk{i:03d}', d) for i in range(0, 100, 3) for d in ('rl2', 'sep')]
+    return SQLiteAXL(numplan, devices, mappings)
+
+
+@pytest.mark.parametrize('page_size', [1, 7, 50, 5000])
+def test_each_pattern_once(axl, page_size):
+    patterns = list(axl.sql_list_pattern(page_size=page_size))
+    assert [p.pkid for p in patterns] == [f'pk{i:03d}' for i in range(100)]
+    assert axl.queries == 100 // page_size + 1
+
+
+def test_partition(axl):
+    patterns = list(axl.sql_list_pattern(partition='other', usage=3, page_size=3))
+    assert [p.pkid for p in patterns] == [f'pk{i:03d}' for i in range(0, 100, 5)]
+    assert patterns[1] == SQLPattern('pk005', '\\+520000000005', 'other', True, False, None)
@@ -0,0 +1,108 @@
+"""
+Reading the CSV of a ZIP file while the ZIP file is streamed
+"""
+import io
+import os
+import zipfile
+from io import TextIOWrapper
+
+import numpy as np
+import pytest
+
+import mxnumplan
+from mxnumplan import NumberRanges
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ZIP_NAME = os.path.join(REPO, 'pnn_Publico_13_05_2019.zip')
+
+
+class Unseekable(io.RawIOBase):
+    """
+    write only stream: zipfile writes the CRC and sizes in a data descriptor after the data
+    """
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.buffer.write(b)
+
+
+def csv_text(rows=2000):
+    lines = ['CLAVE_CENSAL,POBLACION,NIR,SERIE,NUMERACION_INICIAL,NUMERACION_FINAL,TIPO_RED,RAZON_SOCIAL']
+    lines.extend(f'{i:09d},CIUDAD DE MÉXICO,55,{1000 + i // 10},{i % 10}000,{i % 10}999,'
+                 f'{"MOVIL" if i % 3 else "FIJO"},"TELÉFONOS, S.A."' for i in range(rows))
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def zip_bytes(text, compression=zipfile.ZIP_DEFLATED, seekable=True):
+    f = io.BytesIO() if seekable else Unseekable()
+    with zipfile.ZipFile(f, mode='w', compression=compression) as zip_file:
+        with zip_file.open('pnn_Publico_01_01_2020.csv', mode='w') as csv_file:
+            csv_file.write(text.encode('utf8'))
+    return (f if seekable else f.buffer).getvalue()
+
+
+def zipfile_lines(content):
+    with zipfile.ZipFile(io.BytesIO(content)) as zip_file:
+        with zip_file.open(zip_file.filelist[0].filename) as csv_file:
+            return list(TextIOWrapper(csv_file, encoding='utf8', newline=''))
+
+
+def chunked(content, size):
+    return (content[i:i + size] for i in range(0, len(content), size))
+
+
+def assert_same_ranges(a: NumberRanges, b: NumberRanges):
+    for array in NumberRanges.ARRAYS:
+        assert np.array_equal(getattr(a, array), getattr(b, array))
+    assert a.network_types == b.network_types
+
+
+@pytest.mark.parametrize('compression, seekable', [(zipfile.ZIP_DEFLATED, True), (zipfile.ZIP_DEFLATED, False),
+                                                   (zipfile.ZIP_STORED, True)])
+@pytest.mark.parametrize('size', [1, 13, 4096, 10 ** 7])
+def test_like_zipfile(compression, seekable, size):
+    content = zip_bytes(csv_text(), compression, seekable)
+    assert list(mxnumplan.csv_lines_from_zip_stream(chunked(content, size))) == zipfile_lines(content)
+
+
+@pytest.mark.parametrize('size', [1000, 65536])
+def test_snapshot_like_zipfile(size):
+    with open(ZIP_NAME, 'rb') as f:
+        content = f.read()
+    assert list(mxnumplan.csv_lines_from_zip_stream(chunked(content, size))) == zipfile_lines(content)
+    assert_same_ranges(mxnumplan.ranges_from_zip_stream(chunked(content, size)), mxnumplan.ranges_from_file(ZIP_NAME))
+
+
+def test_no_trailing_line_break():
+    content = zip_bytes(csv_text().rstrip('\r\n'))
+    assert list(mxnumplan.csv_lines_from_zip_stream(chunked(content, 100))) == zipfile_lines(content)
+
+
+def test_truncated():
+    content = zip_bytes(csv_text())
+    with pytest.raises(ValueError, match='truncated'):
+        list(mxnumplan.csv_lines_from_zip_stream(chunked(content[:len(content) // 2], 100)))
+
+
+def test_crc_mismatch():
+    text = csv_text()
+    content = zip_bytes(text, zipfile.ZIP_STORED)
+    # change a digit of the stored CSV
+    i = content.index(text[200:220].encode('utf8'))
+    content = content[:i] + (b'1' if content[i:i + 1] == b'0' else b'0') + content[i + 1:]
+    with pytest.raises(ValueError, match='CRC'):
+        list(mxnumplan.csv_lines_from_zip_stream(chunked(content, 100)))
+
+
+def test_unsupported():
+    with pytest.raises(ValueError, match='unsupported'):
+        list(mxnumplan.csv_lines_from_zip_stream(chunked(b'PK\x01\x02' + bytes(100), 100)))
+    # stored data w/o sizes in the local file header
+    content = zip_bytes(csv_text(), zipfile.ZIP_STORED, seekable=False)
+    with pytest.raises(ValueError, match='unsupported'):
+        list(mxnumplan.csv_lines_from_zip_stream(chunked(content, 100)))
@@ -2,17 +2,100 @@
 AXL helper to wrap SOAP methods created based on the UCM AXL WSDL
 """
 import zeep
-import zeep.cache
+import zeep.wsdl
+import zeep.xsd
 import zeep.helpers
 import zeep.exceptions
+import zeep.proxy
 import requests
-import tempfile
+import requests.adapters
 import os
-from collections import OrderedDict
+import asyncio
+import threading
+import functools
+import time
+from collections import OrderedDict, namedtuple
+from xml.sax.saxutils import escape
+from lxml import etree
+
+try:
+    # httpx is only required by AsyncAXLHelper
+    import httpx
+except ImportError:
+    httpx = None
+
+# pattern as read by AXLHelper.sql_list_pattern
+SQLPattern = namedtuple('SQLPattern', ['pkid', 'dnorpattern', 'partition', 'block_enable', 'urgency', 'route_list'])
+
+# parsed WSDL documents by AXL version, shared by all AXL helpers of the process. Not persisted: each process still
+# parses the WSDL once
+_wsdl_documents = {}
+_wsdl_lock = threading.Lock()
+
+
+def wsdl_document(version):
+    """
+    Get the parsed AXL WSDL for a given version. Parsing the WSDL and schema takes about a second; the parsed document
+    does not depend on the UCM host and is parsed only once per process. This only saves time if a process creates
+    more than one AXL helper, for example to provision several clusters. A single cluster run still pays for one
+    parse: the parsed document contains dynamically created zeep types and can't be persisted across processes
+    :param version: String of WSDL version to use. For example: '12.0'
+    :return: zeep WSDL document
+    """
+    with _wsdl_lock:
+        document = _wsdl_documents.get(version)
+        if document is None:
+            wsdl = os.path.join(os.path.dirname(__file__), 'WSDL', version, 'AXLAPI.wsdl')
+            document = zeep.wsdl.Document(wsdl, zeep.Transport(), settings=zeep.Settings())
+            _wsdl_documents[version] = document
+    return document
+
+
+def observe(observers, operation, func, *args, **kwargs):
+    """
+    Call an AXL operation and report the call to observers
+    :param observers: callables called with (name of the operation, duration in seconds, exception or None)
+    :param operation: name of the AXL operation
+    :param func: function sending the AXL request
+    :return: result of func
+    """
+    start = time.perf_counter()
+    try:
+        r = func(*args, **kwargs)
+    except Exception as e:
+        for observer in observers:
+            observer(operation, time.perf_counter() - start, e)
+        raise
+    for observer in observers:
+        observer(operation, time.perf_counter() - start, None)
+    return r
+
+
+class ObservedServiceProxy(zeep.proxy.ServiceProxy):
+    """
+    zeep service proxy which reports each call of an operation to observers
+    """
+
+    def __init__(self, client, binding, observers, **binding_options):
+        """
+        :param observers: list of callables; see observe(). Observers can be added to the list at any time
+        """
+        super().__init__(client, binding, **binding_options)
+        self._observers = observers
+
+    def __getitem__(self, key):
+        operation = super().__getitem__(key)
+        if not self._observers:
+            return operation
+        return functools.partial(observe, self._observers, key, operation)
 
 
 class AXLHelper:
-    def __init__(self, ucm_host, auth, version=None, verify=None, timeout=60):
+    # fault messages used by UCM when AXL requests are throttled
+    THROTTLING_FAULTS = ['Maximum AXL Memory Allocation Consumed', 'AXL Service is busy', 'throttl']
+
+    def __init__(self, ucm_host, auth, version=None, verify=None, timeout=60, pool_maxsize=None, lean=False,
+                 lean_list=False):
         """
 
         :param ucm_host: IP/FQDN of host to direct AXL requests to, optional with port spec
@@ -20,7 +103,20 @@ class AXLHelper:
         :param version: String of WSDL version to use. For example: '12.0'
         :param verify: set to False to disable SSL key validation
         :param timeout: zeep timeout
+        :param pool_maxsize: max number of HTTPS connections to keep open. Set to the number of threads sending
+            requests concurrently
+        :param lean: use the lean SOAP fast path for the add and remove operations in LEAN_OPERATIONS. These then
+            return {'return': uuid} instead of zeep's response object
+        :param lean_list: also use the lean SOAP fast path for the list operations in LEAN_LIST_OPERATIONS. Rows are
+            then returned with string values and only the returned tags; see lean_row()
         """
+        self.lean = lean
+        self.lean_list = lean_list
+        # called for each AXL request; see add_observer()
+        self.observers = []
+        # per operation: body type, envelope head and tail and HTTP headers
+        self._lean_templates = {}
+        self.timeout = timeout
         self.ucm_host = ucm_host
         if not ':' in ucm_host:
             ucm_host += ':8443'
@@ -30,6 +126,8 @@ class AXLHelper:
         self.session.auth = auth
         if verify is not None:
             self.session.verify = verify
+        if pool_maxsize is not None:
+            self.session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize))
 
         if version is None:
             # Somehow determine the UCM version
@@ -37,22 +135,26 @@ class AXLHelper:
 
         wsdl_version = version
 
-        self.wsdl = os.path.join(os.path.dirname(__file__), 'WSDL', wsdl_version, 'AXLAPI.wsdl')
-
-        self.cache = zeep.cache.SqliteCache(
-            path=os.path.join(tempfile.gettempdir(), 'sqlite_{}.db'.format(self.ucm_host)),
-            timeout=60)
+        self.wsdl = wsdl_document(wsdl_version)
 
+        # the WSDL and schema are local files: no need for a cache of remote documents
         self.client = zeep.Client(wsdl=self.wsdl,
                                   transport=zeep.Transport(timeout=timeout,
                                                            operation_timeout=timeout,
-                                                           cache=self.cache,
                                                            session=self.session))
 
-        self.service = self.client.create_service('{http://www.cisco.com/AXLAPIService/}AXLAPIBinding',
-                                                  self.axl_url)
+        binding = self.wsdl.bindings['{http://www.cisco.com/AXLAPIService/}AXLAPIBinding']
+        self.service = ObservedServiceProxy(self.client, binding, self.observers, address=self.axl_url)
         return
 
+    def add_observer(self, observer):
+        """
+        Add an observer called for each AXL request; for example to measure latencies
+        :param observer: callable called with (name of the operation, duration in seconds, exception or None)
+        :return:
+        """
+        self.observers.append(observer)
+
     def __getattr__(self, item):
         """
         unknown attributes are mapped to attributes of the zeep session.
@@ -74,6 +176,19 @@ class AXLHelper:
 
         return [OrderedDict(((t.tag, t.text) for t in row)) for row in r['return']['row']]
 
+    def sql_query_rows(self, query):
+        """
+        execute an SQL query w/o creating a dict per record
+        :param query: SQL query
+        :return: list of tuples; each tuple representing one record with the columns in order of the query
+        """
+        r = self.service.executeSQLQuery(sql=query)
+
+        if r['return'] is None:
+            return []
+
+        return [tuple(t.text for t in row) for row in r['return']['row']]
+
     def sql_update(self, sql):
         """
         Execute an SQL update
@@ -104,6 +219,20 @@ class AXLHelper:
             search_criteria[default_search_criteria] = '%'
         return search_criteria
 
+    @staticmethod
+    def is_throttling_error(e):
+        """
+        Check whether an exception raised by an AXL request indicates that UCM throttles AXL requests
+        :param e: exception
+        :return: True if the request should be retried later
+        """
+        if isinstance(e, zeep.exceptions.TransportError):
+            return e.status_code == 503
+        if isinstance(e, zeep.exceptions.Fault):
+            message = (e.message or '').lower()
+            return any(f.lower() in message for f in AXLHelper.THROTTLING_FAULTS)
+        return False
+
     @staticmethod
     def handle_list_response(r):
         if r['return'] is None:
@@ -111,6 +240,198 @@ class AXLHelper:
         r = r['return'][next((r for r in r['return']))]
         return [zeep.helpers.serialize_object(s) for s in r]
 
+    ################ lean SOAP
+    # operations on the provisioning hot path which bypass zeep's serialization and deserialization
+    LEAN_OPERATIONS = {'addTransPattern', 'removeTransPattern', 'listTransPattern',
+                       'addRoutePattern', 'removeRoutePattern', 'listRoutePattern'}
+    # list operations only take the fast path if enabled with lean_list: the rows differ from zeep's rows
+    LEAN_LIST_OPERATIONS = {'listTransPattern', 'listRoutePattern'}
+    SOAP_ENV = 'http://schemas.xmlsoap.org/soap/envelope/'
+
+    # child elements of XSD types for lean_render
+    _lean_elements = {}
+    # marker for required elements w/o default value
+    _REQUIRED = object()
+    # returned by lean_call if the request was not sent because it can't be rendered w/o zeep
+    LEAN_UNAVAILABLE = object()
+
+    @classmethod
+    def lean_elements(cls, xsd_type):
+        """
+        child elements of a complex XSD type in schema order
+        :param xsd_type: zeep XSD type
+        :return: OrderedDict element name -> (XSD type of the element, value to render if the value is missing). The
+            value to render is None for optional elements, _REQUIRED for required elements which need a value and
+            '' with nillable set for elements rendered as nil. None if the type has particles lean_render can't handle
+        """
+        if xsd_type in cls._lean_elements:
+            return cls._lean_elements[xsd_type]
+        elements = OrderedDict()
+
+        def walk(particle, optional):
+            if isinstance(particle, zeep.xsd.Element):
+                if optional or not particle.min_occurs:
+                    missing = None
+                elif particle.default is not None:
+                    missing = particle.default
+                elif particle.nillable:
+                    missing = ''
+                else:
+                    missing = cls._REQUIRED
+                elements[particle.name] = (particle.type, missing, particle.nillable)
+                return True
+            if isinstance(particle, (zeep.xsd.Sequence, zeep.xsd.All, zeep.xsd.Choice)):
+                # elements in a choice are optional. AXL wraps the content of most types in an optional sequence;
+                # like zeep we still render the required elements of such a sequence
+                return all(walk(child, optional or isinstance(particle, zeep.xsd.Choice)) for child in particle)
+            if isinstance(particle, zeep.xsd.Group):
+                return walk(particle.child, optional)
+            return False
+
+        if not all(walk(particle, False) for _, particle in getattr(xsd_type, 'elements_nested', [])):
+            elements = None
+        cls._lean_elements[xsd_type] = elements
+        return elements
+
+    @classmethod
+    def lean_render(cls, xsd_type, values):
+        """
+        render values of a complex XSD type as XML. Child elements are rendered in schema order; missing required
+        elements are rendered with their default value or as nil, like zeep does
+        :param xsd_type: zeep XSD type
+        :param values: dict of values; a list of values renders a repeated element
+        :return: XML string or None if the values can't be rendered w/o zeep
+        """
+        elements = cls.lean_elements(xsd_type)
+        if not elements or any(k not in elements for k in values):
+            # simple content with attributes, unknown elements, ...
+            return None
+        parts = []
+        for name, (element_type, missing, nillable) in elements.items():
+            value = values.get(name)
+            if value is None:
+                if missing is None:
+                    continue
+                if missing is cls._REQUIRED:
+                    return None
+                if nillable:
+                    parts.append('<{name} xsi:nil="true"/>'.format(name=name))
+                    continue
+                value = missing
+            for v in value if isinstance(value, list) else [value]:
+                if isinstance(v, dict):
+                    text = cls.lean_render(element_type, v)
+                    if text is None:
+                        return None
+                elif isinstance(v, bool):
+                    text = 'true' if v else 'false'
+                else:
+                    text = escape(str(v))
+                parts.append('<{name}>{text}</{name}>'.format(name=name, text=text))
+            # for
+        # for
+        return ''.join(parts)
+
+    @staticmethod
+    def lean_row(element):
+        """
+        dict representing one element of a list response. Values are strings; foreign keys are represented like zeep
+        does: {'_value_1': name, 'uuid': uuid}. Unlike zeep's rows values are not converted to their XSD types (for
+        example blockEnable is 'false', not False) and only the returned tags are present
+        """
+        row = OrderedDict()
+        for child in element:
+            if len(child):
+                row[child.tag] = AXLHelper.lean_row(child)
+            elif child.get('uuid') is not None:
+                row[child.tag] = OrderedDict((('_value_1', child.text), ('uuid', child.get('uuid'))))
+            else:
+                row[child.tag] = child.text
+        # for
+        row['uuid'] = element.get('uuid')
+        return row
+
+    def lean_call(self, operation, **values):
+        """
+        Fast path for the operations in LEAN_OPERATIONS: the request body is rendered directly from the values and the
+        response is parsed incrementally
+        :param operation: name of the AXL operation
+        :param values: parameters of the AXL operation
+        :return: text of the <return> element (None for an empty <return/>) or, for list operations, list of dicts
+            representing the returned objects. LEAN_UNAVAILABLE if the request was not sent: the fast path is disabled
+            or the request can't be rendered w/o zeep. Only then the caller falls back to zeep; a request sent once is
+            never repeated
+        """
+        if not self.lean or operation not in self.LEAN_OPERATIONS:
+            return self.LEAN_UNAVAILABLE
+        if operation in self.LEAN_LIST_OPERATIONS and not self.lean_list:
+            return self.LEAN_UNAVAILABLE
+        template = self._lean_templates.get(operation)
+        if template is None:
+            binding_operation = self.service._binding._operations[operation]
+            qname = etree.QName(binding_operation.input.body.qname)
+            head = '<?xml version="1.0" encoding="utf-8"?>' \
+                   '<soapenv:Envelope xmlns:soapenv="{soap_env}" ' \
+                   'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><soapenv:Body>' \
+                   '<ns:{operation} xmlns:ns="{namespace}">'.format(soap_env=self.SOAP_ENV, operation=qname.localname,
+                                                                   namespace=qname.namespace)
+            tail = '</ns:{operation}></soapenv:Body></soapenv:Envelope>'.format(operation=qname.localname)
+            headers = {'Content-Type': 'text/xml; charset=utf-8',
+                       'SOAPAction': '"{}"'.format(binding_operation.soapaction)}
+            template = (binding_operation.input.body.type, head, tail, headers)
+            self._lean_templates[operation] = template
+        body_type, head, tail, headers = template
+        body = self.lean_render(body_type, values)
+        if body is None:
+            return self.LEAN_UNAVAILABLE
+        data = (head + body + tail).encode('utf-8')
+        if self.observers:
+            return observe(self.observers, operation, self.lean_post, operation, data, headers)
+        return self.lean_post(operation, data, headers)
+
+    def lean_post(self, operation, data, headers):
+        """
+        Send a request rendered by lean_call and parse the response
+        :param operation: name of the AXL operation
+        :param data: SOAP envelope
+        :param headers: HTTP headers
+        :return: see lean_call()
+        """
+        r = self.session.post(self.axl_url, data=data, timeout=self.timeout, stream=True, headers=headers)
+        try:
+            if r.status_code != 200:
+                # faults come with status 500; anything else is a transport error
+                try:
+                    fault = etree.fromstring(r.content).find('.//{{{}}}Fault'.format(self.SOAP_ENV))
+                except etree.XMLSyntaxError:
+                    fault = None
+                if fault is None:
+                    raise zeep.exceptions.TransportError(
+                        'Server returned HTTP status {} ({})'.format(r.status_code, r.content or 'no content available'),
+                        status_code=r.status_code, content=r.content)
+                raise zeep.exceptions.Fault(fault.findtext('faultstring'), code=fault.findtext('faultcode'),
+                                            detail=fault.find('detail'))
+
+            # parse the response incrementally; list responses can have many thousand objects
+            r.raw.decode_content = True
+            result = None
+            for _, element in etree.iterparse(r.raw, events=('end',)):
+                parent = element.getparent()
+                if parent is not None and parent.tag == 'return':
+                    if result is None:
+                        result = []
+                    result.append(self.lean_row(element))
+                    element.clear()
+                    # also drop the references of the parent to rows already processed
+                    while element.getprevious() is not None:
+                        del parent[0]
+                elif element.tag == 'return' and result is None:
+                    result = element.text if not operation.startswith('list') else []
+            # for
+        finally:
+            r.close()
+        return result
+
     ################ service parameter
     def get_service_parameter(self, process_node_name, name, service):
         tags = ['name', 'service', 'value', 'valueType', 'processNodeName']
@@ -296,8 +617,11 @@ class AXLHelper:
                                                       'pattern')
         returned_tags = returned_tags or self.ROUTE_PATTERN_TAGS
 
-        r = self.service.listRoutePattern(searchCriteria=search_criteria,
-                                          returnedTags={t:'' for t in returned_tags})
+        returned_tags = {t: '' for t in returned_tags}
+        r = self.lean_call('listRoutePattern', searchCriteria=search_criteria, returnedTags=returned_tags)
+        if r is not self.LEAN_UNAVAILABLE:
+            return r
+        r = self.service.listRoutePattern(searchCriteria=search_criteria, returnedTags=returned_tags)
         return self.handle_list_response(r)
 
     def get_route_pattern(self, returned_tags = None, **search_criteria):
@@ -317,6 +641,9 @@ class AXLHelper:
 
     def add_route_pattern(self, **values):
         # values = self.filter_search_criteria(values, self.ROUTE_PATTERN_TAGS)
+        r = self.lean_call('addRoutePattern', routePattern=values)
+        if r is not self.LEAN_UNAVAILABLE:
+            return r
         r = self.service.addRoutePattern(routePattern=values)
         return r['return']
 
@@ -355,6 +682,9 @@ class AXLHelper:
         return p
 
     def remove_route_pattern(self, uuid):
+        r = self.lean_call('removeRoutePattern', uuid=uuid)
+        if r is not self.LEAN_UNAVAILABLE:
+            return {'return': r}
         r = self.service.removeRoutePattern(uuid=uuid)
         return r
 
@@ -518,8 +848,11 @@ class AXLHelper:
 
         search_criteria = self.filter_search_criteria(search_criteria, ['pattern', 'description', 'routePartitionName'],
                                                       'pattern')
-        r = self.service.listTransPattern(searchCriteria=search_criteria,
-                                          returnedTags={t: '' for t in returned_tags})
+        returned_tags = {t: '' for t in returned_tags}
+        r = self.lean_call('listTransPattern', searchCriteria=search_criteria, returnedTags=returned_tags)
+        if r is not self.LEAN_UNAVAILABLE:
+            return r
+        r = self.service.listTransPattern(searchCriteria=search_criteria, returnedTags=returned_tags)
         return self.handle_list_response(r)
 
     def add_translation(self, pattern, partition, description,
@@ -528,7 +861,29 @@ class AXLHelper:
                         block_enable=False, urgency=True,
                         outside_dial_tone=False, css_inheritance=True,
                         dont_wait_for_idt=True):
-        translation = {
+        translation = self.translation_values(pattern, partition, description,
+                                              digit_discard=digit_discard, prefix_digits=prefix_digits,
+                                              called_party_transformation_mask=called_party_transformation_mask,
+                                              block_enable=block_enable, urgency=urgency,
+                                              outside_dial_tone=outside_dial_tone, css_inheritance=css_inheritance,
+                                              dont_wait_for_idt=dont_wait_for_idt)
+        r = self.lean_call('addTransPattern', transPattern=translation)
+        if r is not self.LEAN_UNAVAILABLE:
+            return {'return': r}
+        r = self.service.addTransPattern(transPattern=translation)
+        return r
+
+    @staticmethod
+    def translation_values(pattern, partition, description,
+                           digit_discard='', prefix_digits='',
+                           called_party_transformation_mask='',
+                           block_enable=False, urgency=True,
+                           outside_dial_tone=False, css_inheritance=True,
+                           dont_wait_for_idt=True):
+        """
+        transPattern values for addTransPattern
+        """
+        return {
             'pattern': pattern,
             'routePartitionName': partition,
             'description': description,
@@ -542,8 +897,6 @@ class AXLHelper:
             'dontWaitForIDTOnSubsequentHops': dont_wait_for_idt,
             'calledPartyTransformationMask': called_party_transformation_mask
         }
-        r = self.service.addTransPattern(transPattern=translation)
-        return r
 
     def add_update_translation(self, pattern, partition, description,
                                digit_discard='', prefix_digits='',
@@ -576,10 +929,138 @@ class AXLHelper:
             p = self.service.updateTransPattern(**translation)
         return p['return']
 
+    def update_translation(self, **values):
+        r = self.service.updateTransPattern(**values)
+        return r['return']
+
     def remove_translation(self, uuid):
+        r = self.lean_call('removeTransPattern', uuid=uuid)
+        if r is not self.LEAN_UNAVAILABLE:
+            return {'return': r}
         r = self.service.removeTransPattern(uuid=uuid)
         return r
 
+    ########## numplan via SQL
+    # typepatternusage enums
+    PATTERN_USAGE_TRANSLATION = 3
+    PATTERN_USAGE_ROUTE = 5
+
+    def sql_list_pattern(self, partition=None, usage=None, page_size=5000):
+        """
+        list patterns with paged SQL queries. Pages are requested as the generator is consumed so that large
+        partitions don't hit the AXL response size limit and processing can start with the first page
+        :param partition: partition name
+        :param usage: pattern usage (typepatternusage enum), for example PATTERN_USAGE_TRANSLATION
+        :param page_size: number of patterns to read with a single SQL query
+        :return: generator yielding SQLPattern tuples (pkid, dnorpattern, partition, block_enable, urgency, route_list)
+        """
+        last_pkid = ''
+        while True:
+            rows = self.sql_query_rows(self.sql_list_pattern_query(partition, usage, page_size, last_pkid))
+            for row in rows:
+                yield self.sql_pattern(row)
+            if len(rows) < page_size:
+                break
+            last_pkid = rows[-1][0]
+        # while
+        return
+
+    @staticmethod
+    def sql_list_pattern_query(partition, usage, page_size, last_pkid):
+        """
+        SQL query to read one page of patterns for sql_list_pattern
+        :param partition: partition name or None
+        :param usage: pattern usage (typepatternusage enum) or None
+        :param page_size: number of patterns to read
+        :param last_pkid: pkid of the last pattern of the previous page; '' for the first page
+        :return: SQL query
+        """
+        condition = ''
+        if partition is not None:
+            condition += ' and p.name = \'{}\''.format(partition.replace("'", "''"))
+        if usage is not None:
+            condition += ' and n.tkpatternusage = {}'.format(int(usage))
+        # keyset pagination on pkid. A numplan entry can be mapped to more than one device (shared lines): group by
+        # pkid so that each pattern is returned exactly once and the last pkid of a page is the last pattern
+        return 'select first {page_size} n.pkid, n.dnorpattern, p.name as partitionname, n.blockenable, ' \
+               'n.patternurgency, max(d.name) as routelistname from numplan n ' \
+               'inner join routepartition p on n.fkroutepartition = p.pkid ' \
+               'left outer join devicenumplanmap m on m.fknumplan = n.pkid ' \
+               'left outer join device d on m.fkdevice = d.pkid ' \
+               'where n.pkid > \'{last_pkid}\'{condition} ' \
+               'group by n.pkid, n.dnorpattern, p.name, n.blockenable, n.patternurgency ' \
+               'order by n.pkid'.format(page_size=int(page_size), condition=condition, last_pkid=last_pkid)
+
+    @staticmethod
+    def sql_pattern(row):
+        """
+        SQLPattern from a row returned by a sql_list_pattern_query query
+        """
+        pkid, pattern, partition, block_enable, urgency, route_list = row
+        return SQLPattern(pkid, pattern, partition, block_enable == 't', urgency == 't', route_list)
+
+    def sql_remove_pattern(self, pkids, batch_size=200):
+        """
+        remove patterns by pkid with batched SQL delete statements
+        :param pkids: pkids of the patterns to remove. pkids in thick AXL format ({UUID}) are converted
+        :param batch_size: max number of patterns to remove with a single SQL statement
+        :return: generator yielding the number of removed patterns for each batch
+        """
+        for sql in self.sql_remove_pattern_statements(pkids, batch_size):
+            yield int(self.sql_update(sql=sql))
+        return
+
+    def sql_existing_pattern(self, pkids, batch_size=200):
+        """
+        determine which of the given patterns exist; for example to tell which patterns a batched SQL delete removed
+        :param pkids: pkids of patterns. pkids in thick AXL format ({UUID}) are converted
+        :param batch_size: max number of pkids to check with a single SQL query
+        :return: set of the pkids of existing patterns; lowercase w/o curly brackets
+        """
+        existing = set()
+        for sql in self.sql_existing_pattern_queries(pkids, batch_size):
+            existing.update(row[0] for row in self.sql_query_rows(sql))
+        return existing
+
+    @staticmethod
+    def sql_existing_pattern_queries(pkids, batch_size):
+        """
+        SQL queries for sql_existing_pattern
+        :param pkids: pkids of patterns
+        :param batch_size: max number of pkids to check with a single SQL query
+        :return: generator yielding SQL queries
+        """
+        for batch in AXLHelper.sql_pkid_lists(pkids, batch_size):
+            yield 'select pkid from numplan where pkid in ({pkids})'.format(pkids=batch)
+        return
+
+    @staticmethod
+    def sql_remove_pattern_statements(pkids, batch_size):
+        """
+        SQL delete statements for sql_remove_pattern
+        :param pkids: pkids of the patterns to remove
+        :param batch_size: max number of patterns to remove with a single SQL statement
+        :return: generator yielding SQL statements
+        """
+        for batch in AXLHelper.sql_pkid_lists(pkids, batch_size):
+            yield 'delete from numplan where pkid in ({pkids})'.format(pkids=batch)
+        return
+
+    @staticmethod
+    def sql_pkid_lists(pkids, batch_size):
+        """
+        batches of pkids as SQL lists
+        :param pkids: pkids; pkids in thick AXL format ({UUID}) are converted
+        :param batch_size: max number of pkids per batch
+        :return: generator yielding comma separated lists of quoted pkids
+        """
+        # UUIDs obtained via thick AXL are uppercase and embedded in curly brackets
+        pkids = [p.strip('{}').lower() for p in pkids]
+        for i in range(0, len(pkids), batch_size):
+            batch = pkids[i:i + batch_size]
+            yield ','.join('\'{}\''.format(p.replace("'", "''")) for p in batch)
+        return
+
     ########## CnPTx
     def add_update_cnptx(self, pattern, partition, description, discard, prefix, plan, type, mask=''):
         trans = {
@@ -1009,4 +1490,238 @@ class AXLHelper:
         else:
             pbt.pop('basePhoneTemplateName', None)
             r = self.service.updatePhoneButtonTemplate(**pbt)
-        return r['return']
\ No newline at end of file
+        return r['return']
+
+
+class AsyncAXLHelper:
+    """
+    asyncio variant of AXLHelper based on zeep's async transport. Each request only holds a coroutine instead of a
+    thread so that a single process can keep many requests in flight against one or several UCM clusters.
+    Supports the pattern, partition and SQL subset of the AXLHelper methods; all methods are coroutines.
+    """
+
+    def __init__(self, ucm_host, auth, version=None, verify=None, timeout=60, max_concurrency=8):
+        """
+
+        :param ucm_host: IP/FQDN of host to direct AXL requests to, optional with port spec
+        :param auth: passed to httpx.AsyncClient. For basic authentication simply pass a (user/password) tuple
+        :param version: String of WSDL version to use. For example: '12.0'
+        :param verify: set to False to disable SSL key validation
+        :param timeout: request timeout
+        :param max_concurrency: max number of requests in flight. Also used as size of the HTTPS connection pool
+        """
+        if httpx is None:
+            raise ImportError('AsyncAXLHelper requires httpx')
+        self.ucm_host = ucm_host
+        if not ':' in ucm_host:
+            ucm_host += ':8443'
+        self.axl_url = 'https://{ucm_host}/axl/'.format(ucm_host=ucm_host)
+
+        if version is None:
+            # Somehow determine the UCM version
+            raise Exception('Not implemented')
+
+        self.wsdl = wsdl_document(version)
+
+        self.http_client = httpx.AsyncClient(auth=auth,
+                                             verify=True if verify is None else verify,
+                                             timeout=timeout,
+                                             limits=httpx.Limits(max_connections=max_concurrency,
+                                                                 max_keepalive_connections=max_concurrency))
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.client = zeep.AsyncClient(wsdl=self.wsdl,
+                                       transport=zeep.transports.AsyncTransport(client=self.http_client,
+                                                                                timeout=timeout,
+                                                                                operation_timeout=timeout))
+
+        # zeep.AsyncClient.create_service() returns a synchronous proxy; bind the async proxy explicitly
+        binding = self.client.wsdl.bindings['{http://www.cisco.com/AXLAPIService/}AXLAPIBinding']
+        self.service = zeep.proxy.AsyncServiceProxy(self.client, binding, address=self.axl_url)
+        return
+
+    async def aclose(self):
+        """
+        close the HTTPS connection pool
+        """
+        await self.http_client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def call(self, operation, **kwargs):
+        """
+        call an AXL operation; at most max_concurrency calls are in flight at any time
+        :param operation: name of the AXL operation, for example 'addTransPattern'
+        :param kwargs: parameters of the AXL operation
+        :return: AXL response
+        """
+        async with self.semaphore:
+            return await self.service[operation](**kwargs)
+
+    async def sql_query(self, query):
+        """
+        execute an SQL query
+        :param query: SQL query
+        :return: list of dict; each dict representing one record
+        """
+        r = await self.call('executeSQLQuery', sql=query)
+
+        if r['return'] is None:
+            return []
+
+        return [OrderedDict(((t.tag, t.text) for t in row)) for row in r['return']['row']]
+
+    async def sql_query_rows(self, query):
+        """
+        execute an SQL query w/o creating a dict per record
+        :param query: SQL query
+        :return: list of tuples; each tuple representing one record with the columns in order of the query
+        """
+        r = await self.call('executeSQLQuery', sql=query)
+
+        if r['return'] is None:
+            return []
+
+        return [tuple(t.text for t in row) for row in r['return']['row']]
+
+    async def sql_update(self, sql):
+        """
+        Execute an SQL update
+        :param sql:  SQL statement
+        :return: number of updated rows
+        """
+        r = await self.call('executeSQLUpdate', sql=sql)
+        return r['return']['rowsUpdated']
+
+    ################ route partition
+    async def get_route_partition(self, **search_criteria):
+        search_criteria = AXLHelper.filter_search_criteria(search_criteria, ['name', 'uuid'], 'name')
+        assert len(search_criteria) == 1, 'Only name or uuid can be used'
+
+        tags = ['name', 'description', 'dialPlanWizardGenId', 'timeScheduleIdName', 'useOriginatingDeviceTimeZone',
+                'timeZone', 'partitionUsage']
+        try:
+            r = await self.call('getRoutePartition', returnedTags={t: '' for t in tags}, **search_criteria)
+        except zeep.exceptions.Fault as e:
+            if e.message.startswith('Item not valid'):
+                return None
+            raise
+        return zeep.helpers.serialize_object(r['return']['routePartition'])
+
+    async def add_route_partition(self, **values):
+        r = await self.call('addRoutePartition', routePartition=values)
+        return r['return']
+
+    ################ route list
+    async def get_route_list(self, **search_criteria):
+        search_criteria = AXLHelper.filter_search_criteria(search_criteria, ['name', 'uuid'], 'name')
+        assert len(search_criteria) == 1, 'Only name or uuid can be used'
+
+        tags = ['name', 'description', 'callManagerGroupName', 'routeListEnabled']
+        try:
+            r = await self.call('getRouteList', returnedTags={t: '' for t in tags}, **search_criteria)
+        except zeep.exceptions.Fault as e:
+            if e.message.startswith('Item not valid'):
+                return None
+            raise
+        return zeep.helpers.serialize_object(r['return']['routeList'])
+
+    ################ route pattern
+    async def list_route_pattern(self, returned_tags=None, **search_criteria):
+        search_criteria = AXLHelper.filter_search_criteria(search_criteria,
+                                                           ['pattern', 'description', 'routePartitionName'],
+                                                           'pattern')
+        returned_tags = returned_tags or AXLHelper.ROUTE_PATTERN_TAGS
+        r = await self.call('listRoutePattern', searchCriteria=search_criteria,
+                            returnedTags={t: '' for t in returned_tags})
+        return AXLHelper.handle_list_response(r)
+
+    async def get_route_pattern(self, returned_tags=None, **search_criteria):
+        search_criteria = AXLHelper.filter_search_criteria(search_criteria, ['uuid', 'pattern', 'routePartitionName'])
+        assert search_criteria is not None, 'Search criteria mantatory'
+
+        returned_tags = returned_tags or AXLHelper.ROUTE_PATTERN_TAGS
+        try:
+            r = await self.call('getRoutePattern', returnedTags={t: '' for t in returned_tags}, **search_criteria)
+        except zeep.exceptions.Fault as e:
+            if e.message.startswith('Item not valid'):
+                return None
+            raise
+        return zeep.helpers.serialize_object(r['return']['routePattern'])
+
+    async def add_route_pattern(self, **values):
+        r = await self.call('addRoutePattern', routePattern=values)
+        return r['return']
+
+    async def update_route_pattern(self, **values):
+        r = await self.call('updateRoutePattern', **values)
+        return r['return']
+
+    async def remove_route_pattern(self, uuid):
+        return await self.call('removeRoutePattern', uuid=uuid)
+
+    ################ translation pattern
+    async def list_translation(self, returned_tags=None, **search_criteria):
+        returned_tags = returned_tags or AXLHelper.TRANS_PATTERN_TAGS
+        search_criteria = AXLHelper.filter_search_criteria(search_criteria,
+                                                           ['pattern', 'description', 'routePartitionName'],
+                                                           'pattern')
+        r = await self.call('listTransPattern', searchCriteria=search_criteria,
+                            returnedTags={t: '' for t in returned_tags})
+        return AXLHelper.handle_list_response(r)
+
+    async def add_translation(self, pattern, partition, description, **kwargs):
+        """
+        add a translation pattern
+        :param kwargs: see AXLHelper.add_translation
+        """
+        translation = AXLHelper.translation_values(pattern, partition, description, **kwargs)
+        return await self.call('addTransPattern', transPattern=translation)
+
+    async def update_translation(self, **values):
+        r = await self.call('updateTransPattern', **values)
+        return r['return']
+
+    async def remove_translation(self, uuid):
+        return await self.call('removeTransPattern', uuid=uuid)
+
+    ########## numplan via SQL
+    async def sql_list_pattern(self, partition=None, usage=None, page_size=5000):
+        """
+        list patterns with paged SQL queries; see AXLHelper.sql_list_pattern
+        :return: async generator yielding SQLPattern tuples
+        """
+        last_pkid = ''
+        while True:
+            rows = await self.sql_query_rows(AXLHelper.sql_list_pattern_query(partition, usage, page_size, last_pkid))
+            for row in rows:
+                yield AXLHelper.sql_pattern(row)
+            if len(rows) < page_size:
+                break
+            last_pkid = rows[-1][0]
+        # while
+        return
+
+    async def sql_remove_pattern(self, pkids, batch_size=200):
+        """
+        remove patterns by pkid with batched SQL delete statements. Batches are sent concurrently
+        :param pkids: pkids of the patterns to remove. pkids in thick AXL format ({UUID}) are converted
+        :param batch_size: max number of patterns to remove with a single SQL statement
+        :return: list with the number of removed patterns for each batch
+        """
+        counts = await asyncio.gather(*(self.sql_update(sql=sql)
+                                        for sql in AXLHelper.sql_remove_pattern_statements(pkids, batch_size)))
+        return [int(c) for c in counts]
+
+    async def sql_existing_pattern(self, pkids, batch_size=200):
+        """
+        determine which of the given patterns exist; see AXLHelper.sql_existing_pattern
+        :return: set of the pkids of existing patterns; lowercase w/o curly brackets
+        """
+        rows = await asyncio.gather(*(self.sql_query_rows(sql)
+                                      for sql in AXLHelper.sql_existing_pattern_queries(pkids, batch_size)))
+        return {row[0] for r in rows for row in r}